@@ -0,0 +1,277 @@
+from collections import namedtuple
+from sys import stderr
+from time import perf_counter
+import numpy as np
+from imageio import imread
+from PIL import Image
+from array_store import load_image
+from batch_multiprocessing import pool_multiprocess
+from compositing import alpha_composite_bg
+from image_writer import FINAL, write_image
+from transform_utils import (
+    crop_image, get_neighbour_mask, nearest_upscale, scale_pixel_box_coordinates
+)
+
+__all__ = [
+    "Reconstruction", "reconstruct_alpha", "reconstruct_glyph", "reconstruct_glyphs",
+    "report_reconstructions"
+]
+
+# The residual loss of a reconstruction, i.e. how far recompositing its estimated RGBA
+# onto the background is from the enlarged glyph: the mean absolute difference (in
+# 8-bit levels per channel) and the fraction of pixels which differ at all, along with
+# the number of re-estimation passes it took
+Reconstruction = namedtuple(
+    "Reconstruction", "rgba residual_mae residual_frac iterations"
+)
+
+# Maximum number of alpha re-estimation passes (1 gives the scripts' single pass)
+MAX_ITER = 16
+
+def upscale_to_0_255(img, shape):
+    """
+    Nearest-neighbour upscale the uint8 `img` to `shape`, stretched so its maximum is
+    255 (as the `*_leaf_sr_transparency.py` scripts prepare the source image planes).
+    The stretch is a lookup table over the 256 levels, so the result stays uint8.
+    """
+    scaled = nearest_upscale(img, shape)
+    levels = np.arange(256) * (255 / scaled.max())
+    return np.rint(levels).astype(np.uint8)[scaled]
+
+def composited_gradient(img, scaled_preproc, scaled_alpha):
+    """
+    Return the difference of the enlarged glyph `img` from the upscaled (background
+    composited) source glyph `scaled_preproc`, rescaled from [-255,+255] to [0,1] and
+    weighted by the upscaled source alpha `scaled_alpha`.
+    """
+    composited_grad = img.astype(int) - scaled_preproc
+    composited_grad = (composited_grad + 255) / (255 * 2)
+    composited_grad *= scaled_alpha[:, :, None]
+    composited_grad /= 255
+    return composited_grad
+
+def estimate_alpha(composited_grad, scaled_alpha, scaling_factor):
+    """
+    Estimate the alpha channel of the enlarged glyph from the upscaled source alpha,
+    adjusted by the composited gradient except where the source alpha is opaque
+    throughout a neighbourhood at least half the scaling factor wide (see
+    `get_neighbour_mask`). Returns a float alpha channel in [0,255].
+    """
+    # Rescale all opaque regions to 1 (and clip any above 1 now)
+    previous_max_alpha = scaled_alpha == 255
+    if not previous_max_alpha.any():
+        raise ValueError("Source glyph has no opaque pixels to calibrate against")
+    min_of_previous_max_alpha = composited_grad[previous_max_alpha].min()
+    # Neighbour dist must be greater or equal to half the scaling factor
+    neighbour_dist = int(scaling_factor // 2 + (0 if scaling_factor % 1 == 0 else 1))
+    all_max_neighbours_mask = get_neighbour_mask(
+        scaled_alpha, max_val=255, neighbour_dist=neighbour_dist
+    )
+    edges = ~all_max_neighbours_mask
+    composited_grad = composited_grad * (0.5 / min_of_previous_max_alpha)
+    decomp_alpha = scaled_alpha / 255
+    decomp_alpha[edges] += composited_grad[edges, :].mean(axis=1)
+    decomp_alpha /= decomp_alpha[edges].max()
+    decomp_alpha *= 255
+    decomp_alpha[all_max_neighbours_mask] = 255
+    return decomp_alpha
+
+def alpha_change(recomposited, target_change, img, bg_shade, decomp_alpha, mask):
+    """
+    Solve for the change in alpha (within `mask`) at which recompositing the enlarged
+    glyph `img` onto `bg_shade` would change the R channel of `recomposited` by
+    `target_change`. Since the pixels were picked to change uniformly, R stands in
+    for G and B. From `(α * img + S * (255 - α)) / 255 = recomposited + change`:
+    `α = 255 * (recomposited + change - S) / (img - S)`
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        change = (
+            255 * (recomposited[..., 0].astype(int) + target_change - bg_shade)
+            / (img[..., 0].astype(int) - bg_shade)
+        ) - decomp_alpha
+    change[~mask] = 0
+    change[~np.isfinite(change)] = 0
+    return change
+
+def adjust_alpha(img, rgba, decomp_alpha, recomposited, bg_shade):
+    """
+    Re-estimate the alpha of pixels (any leading shape, with RGB or RGBA last) whose
+    recomposited RGB deviates from `img`, in two parts: fully correcting pixels whose
+    loss is equal across RGB, and partially correcting the rest (towards the smallest
+    of their channels' losses). The alpha channel of the uint8 `rgba` is updated in
+    place and the unrounded (float) alpha is returned.
+    """
+    loss = (img / 2 / 255) - (recomposited / 2 / 255) + 0.5
+    loss_mask = np.any(loss != 0.5, axis=-1)
+    uniform_equal_loss_mask = np.all(np.diff(loss, axis=-1) == 0, axis=-1)
+    partial_loss_mask = loss_mask & ~uniform_equal_loss_mask
+    # Only where alpha is negatively correlated to RGB (⇡A = ⇣RGB) is adjusted
+    if bg_shade < 255:
+        neg_loss_mask = np.all((bg_shade < img), axis=-1) & loss_mask
+    else:
+        neg_loss_mask = np.zeros_like(loss_mask, dtype=bool)
+    adjustment = np.zeros_like(loss)
+    adjustment[neg_loss_mask] = (loss[neg_loss_mask] - 0.5) * 2 * 255
+    # Firstly, do the uniform loss mask completely
+    first_adjustment = adjustment[..., 0] * uniform_equal_loss_mask
+    alpha_change1 = alpha_change(
+        recomposited, first_adjustment, img, bg_shade, decomp_alpha,
+        uniform_equal_loss_mask
+    )
+    # Then do the partial loss mask partially, only going "part of the way" by
+    # targetting the minimum
+    second_adjustment = adjustment.copy()
+    second_adjustment[~partial_loss_mask] = 0
+    second_adjustment_min = second_adjustment.astype(int).min(axis=-1)
+    alpha_change2 = alpha_change(
+        recomposited, second_adjustment_min, img, bg_shade, decomp_alpha,
+        partial_loss_mask
+    )
+    adjusted_alpha = np.clip(rgba[..., 3] + alpha_change1 + alpha_change2, 0, 255)
+    rgba[..., 3] = adjusted_alpha
+    return adjusted_alpha
+
+def reestimate_alpha(img, decomp_alpha, bg_shade, max_iter=MAX_ITER, tol=0):
+    """
+    Recomposite the enlarged glyph `img` with the estimated alpha `decomp_alpha` onto
+    `bg_shade` and re-estimate the alpha where the result deviates from `img` (see
+    `adjust_alpha`), repeating until the residual (mean absolute error, in levels) is
+    at most `tol`, no deviating pixel improves, or `max_iter` passes have been made.
+    The first pass covers the whole frame (snapping pixels which already match too);
+    later passes only gather the active set of pixels still deviating, so their cost
+    tracks the unresolved edge pixels, and only keep the changes which reduce a
+    pixel's error (dropping the rest from the active set). Returns the re-estimated
+    RGBA (uint8), its recomposited RGB, and the number of passes made.
+    """
+    rgba = np.insert(img, 3, decomp_alpha, axis=2)
+    # Rounded integer compositing, taking the full range as [0,255] (the opaque pixels
+    # of the estimated alpha are 255) rather than scaling by the image's maximum
+    recomposited = alpha_composite_bg(rgba, bg_shade, rounded=True)
+    alpha = adjust_alpha(img, rgba, decomp_alpha, recomposited, bg_shade)
+    alpha_composite_bg(rgba, bg_shade, out=recomposited, rounded=True)
+    n_iter = 1
+    # Flat views of (pixel, 1, channel) so a gathered active set is still 3D
+    img_px = np.asarray(img).reshape(-1, 1, 3)
+    rgba_px = rgba.reshape(-1, 1, 4)
+    alpha_px = alpha.reshape(-1, 1)
+    recomposited_px = recomposited.reshape(-1, 1, 3)
+    active = np.flatnonzero(np.any(img != recomposited, axis=2))
+    abs_error = np.abs(img_px[active].astype(int) - recomposited_px[active]).sum()
+    n_values = img_px.size
+    while active.size and n_iter < max_iter and abs_error / n_values > tol:
+        active_img, active_rgba = img_px[active], rgba_px[active]
+        previous = recomposited_px[active]
+        active_alpha = adjust_alpha(
+            active_img, active_rgba, alpha_px[active], previous, bg_shade
+        )
+        active_recomposited = alpha_composite_bg(active_rgba, bg_shade, rounded=True)
+        n_iter += 1
+        error = np.abs(active_img.astype(int) - active_recomposited).sum(axis=(1, 2))
+        previous_error = np.abs(active_img.astype(int) - previous).sum(axis=(1, 2))
+        # Only keep the pixels this pass improved: the rest can't be corrected further
+        improved = error < previous_error
+        updated = active[improved]
+        rgba_px[updated] = active_rgba[improved]
+        alpha_px[updated] = active_alpha[improved]
+        recomposited_px[updated] = active_recomposited[improved]
+        abs_error -= (previous_error - error)[improved].sum()
+        active = updated[error[improved] > 0]
+    return rgba, recomposited, n_iter
+
+def reconstruct_alpha(
+        img, source_img, preproc_img, bg_shade, box=None, max_iter=MAX_ITER, tol=0
+    ):
+    """
+    Reconstruct the transparency of the enlarged glyph `img` (an RGB array, composited
+    onto the grey `bg_shade`) from its RGBA source glyph `source_img` and that glyph
+    composited onto the background, `preproc_img`, optionally within just the `(x,y)`
+    corners `box` of the source glyph, re-estimating the alpha in up to `max_iter`
+    passes until the residual is at most `tol` (see `reestimate_alpha`). Returns a
+    `Reconstruction`.
+    """
+    scale = img.shape[0] / source_img.shape[0]
+    if box is not None:
+        img = crop_image(img, scale_pixel_box_coordinates(box, scale))
+        source_img = crop_image(source_img, box)
+        preproc_img = crop_image(preproc_img, box)
+    img = np.asarray(img)
+    scaled_preproc = upscale_to_0_255(preproc_img[:, :, :3], img.shape)
+    scaled_alpha = upscale_to_0_255(source_img[:, :, 3], img.shape[:2])
+    composited_grad = composited_gradient(img, scaled_preproc, scaled_alpha)
+    decomp_alpha = estimate_alpha(composited_grad, scaled_alpha, scale)
+    rgba, recomposited, n_iter = reestimate_alpha(
+        img, decomp_alpha, bg_shade, max_iter=max_iter, tol=tol
+    )
+    residual = np.abs(img.astype(int) - recomposited.astype(int))
+    return Reconstruction(
+        rgba, residual.mean(), np.any(residual, axis=2).mean(), n_iter
+    )
+
+def reconstruct_glyph(
+        enlarged_png,
+        source_png,
+        preproc_png,
+        output_png,
+        bg_shade,
+        array_dir=None,
+        writer_options=FINAL,
+        max_iter=MAX_ITER,
+        tol=0
+    ):
+    """
+    Reconstruct the transparency of one enlarged glyph (see `reconstruct_alpha`),
+    reading it via the memory-mapped `ArrayStore` in `array_dir` if given, and write it
+    as RGBA to `output_png`. Returns its `Reconstruction` (without the RGBA).
+    """
+    img = load_image(enlarged_png, array_dir)
+    with Image.open(source_png) as source:
+        source_img = np.asarray(source.convert("RGBA")) # a few glyphs are LA
+    preproc_img = imread(preproc_png)
+    reconstruction = reconstruct_alpha(
+        img, source_img, preproc_img, bg_shade, max_iter=max_iter, tol=tol
+    )
+    write_image(reconstruction.rgba, output_png, **writer_options)
+    return reconstruction._replace(rgba=None)
+
+def reconstruct_job(job):
+    """
+    Reconstruct one `(enlarged_png, source_png, preproc_png, output_png, bg_shade,
+    array_dir, writer_options, max_iter, tol)` job, returning its filename, seconds
+    taken and `Reconstruction` (or the exception raised, so one bad glyph doesn't stop
+    the pool)
+    """
+    t0 = perf_counter()
+    try:
+        result = reconstruct_glyph(*job)
+    except Exception as e:
+        result = e
+    return job[0].name, perf_counter() - t0, result
+
+def reconstruct_glyphs(jobs, n_cores=1, show_progress=True):
+    """
+    Run a list of `reconstruct_glyph` argument tuples on `n_cores` worker processes,
+    yielding the filename, seconds taken and `Reconstruction` (or exception) of each
+    glyph in the order they finish.
+    """
+    yield from pool_multiprocess(
+        reconstruct_job, jobs, n_cores, show_progress=show_progress
+    )
+
+def report_reconstructions(results, file=stderr):
+    """
+    Print a summary of the seconds taken and residual losses of a dict of filenames to
+    `(seconds, Reconstruction)` pairs, for comparison between runs
+    """
+    if not results:
+        return
+    seconds = np.array([s for s, _ in results.values()])
+    maes = np.array([r.residual_mae for _, r in results.values()])
+    fracs = np.array([r.residual_frac for _, r in results.values()])
+    iterations = np.array([r.iterations for _, r in results.values()])
+    print(
+        f"Reconstructed {seconds.size} glyphs: {seconds.mean():.2f}s mean, "
+        f"{seconds.max():.2f}s max per glyph ({seconds.sum():.1f}s total), "
+        f"{iterations.mean():.1f} passes mean; residual {maes.mean():.3f} mean "
+        f"absolute error, {fracs.mean():.1%} of pixels differ",
+        file=file
+    )
@@ -0,0 +1,55 @@
+import os
+from pathlib import Path
+import numpy as np
+from glyph_manifest import atomic_output
+
+__all__ = ["ArrayStore", "load_image"]
+
+class ArrayStore:
+    """
+    A directory of one uncompressed `.npy` file per image, memory-mapped when loaded so
+    that a box can be sliced out of it (e.g. by `crop_image`) without decoding the
+    whole image, as reading the PNG would. Each array is stamped with the modification
+    time of the image it was saved from, and rebuilt if the image has since changed.
+    """
+    def __init__(self, store_dir):
+        self.store_dir = Path(store_dir)
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+
+    def array_path(self, image_path):
+        return self.store_dir / f"{Path(image_path).stem}.npy"
+
+    def save(self, img, image_path):
+        "Store `img`, the pixels of the (already written) image at `image_path`"
+        npy = self.array_path(image_path)
+        with atomic_output(npy) as tmp_path:
+            with open(tmp_path, "wb") as f:
+                np.save(f, img)
+        os.utime(npy, ns=(npy.stat().st_atime_ns, Path(image_path).stat().st_mtime_ns))
+
+    def is_stale(self, image_path):
+        npy = self.array_path(image_path)
+        if not npy.exists():
+            return True
+        return npy.stat().st_mtime_ns != Path(image_path).stat().st_mtime_ns
+
+    def load(self, image_path):
+        """
+        Return a read-only memory map of the array of the image at `image_path`,
+        decoding the image into the store first if it's missing or stale (so only the
+        first run after the image is written pays for a full decode).
+        """
+        if self.is_stale(image_path):
+            from image_writer import read_image
+            self.save(read_image(image_path), image_path)
+        return np.load(self.array_path(image_path), mmap_mode="r")
+
+def load_image(image_path, store_dir=None):
+    """
+    Read the image at `image_path`, memory-mapped via the `ArrayStore` in `store_dir`
+    if one is configured, or else decoded in full (without writing any array).
+    """
+    if store_dir is None:
+        from image_writer import read_image
+        return read_image(image_path)
+    return ArrayStore(store_dir).load(image_path)
@@ -1,26 +1,123 @@
 import multiprocessing as mp
-from multiprocessing import Process
-from more_itertools import chunked
+import sys
+import traceback
+from multiprocessing import Process, Pipe
+from multiprocessing.connection import wait
 from tqdm import tqdm
 
-__all__ = ["batch_multiprocess"]
+__all__ = ["batch_multiprocess", "pool_multiprocess", "BatchProcessError"]
+
+class BatchProcessError(RuntimeError):
+    "Raised after a batch has finished if any of its jobs failed"
+    def __init__(self, failures):
+        self.failures = failures # dict of job index: (exit code, traceback or None)
+        summary = "\n".join(
+            f"Job {i} exited with code {code}" + (f":\n{tb}" if tb else "")
+            for i, (code, tb) in failures.items()
+        )
+        super().__init__(f"{len(failures)} job(s) failed:\n{summary}")
+
+def run_and_report(f, conn):
+    """
+    Call `f` in a child process, sending any exception's traceback back through `conn`
+    and exiting with a non-zero code. An integer return value (e.g. from
+    `subprocess.call`) is used as the exit code, so failed subprocesses show up too.
+    """
+    try:
+        result = f()
+    except BaseException:
+        conn.send(traceback.format_exc())
+        conn.close()
+        sys.exit(1)
+    conn.close()
+    if isinstance(result, int) and not isinstance(result, bool):
+        sys.exit(result)
 
 def batch_multiprocess(function_list, n_cores=mp.cpu_count(), show_progress=True):
     """
     Run a list of functions on `n_cores` (default: all CPU cores),
     with the option to show a progress bar using tqdm (default: shown).
+
+    Exactly `n_cores` jobs are kept in flight: the next job starts as soon as any
+    running job finishes (rather than waiting for a whole batch to finish). All jobs
+    are run even if some fail, after which a `BatchProcessError` is raised listing the
+    exit code and traceback of each failure. Returns the list of exit codes.
+    """
+    pending = iter(enumerate(function_list))
+    running = {} # sentinel: (job index, process, receiving end of its pipe)
+    exit_codes = [None] * len(function_list)
+    tracebacks = {}
+    pbar = tqdm(total=len(function_list), disable=not show_progress)
+    try:
+        while True:
+            while len(running) < n_cores:
+                job = next(pending, None)
+                if job is None:
+                    break
+                i, f = job
+                recv_conn, send_conn = Pipe(duplex=False)
+                p = Process(target=run_and_report, args=(f, send_conn))
+                p.start()
+                send_conn.close() # Only the child should hold the sending end
+                running[p.sentinel] = (i, p, recv_conn)
+            if not running:
+                break
+            conns = {conn: s for s, (i, p, conn) in running.items() if conn}
+            ready = wait([*running, *conns])
+            # Read tracebacks as they arrive so that a large one can't block a child
+            for conn in (r for r in ready if r in conns):
+                i, p, _ = running[conns[conn]]
+                try:
+                    tracebacks[i] = conn.recv()
+                except EOFError:
+                    conn.close()
+                    running[conns[conn]] = (i, p, None)
+            for sentinel in (r for r in ready if r in running):
+                i, p, conn = running.pop(sentinel)
+                p.join()
+                if conn:
+                    if conn.poll() and i not in tracebacks:
+                        try:
+                            tracebacks[i] = conn.recv()
+                        except EOFError:
+                            pass
+                    conn.close()
+                exit_codes[i] = p.exitcode
+                pbar.update(1)
+    except KeyboardInterrupt:
+        for i, p, conn in running.values():
+            p.terminate()
+        raise
+    finally:
+        pbar.close()
+    failures = {
+        i: (code, tracebacks.get(i)) for i, code in enumerate(exit_codes) if code != 0
+    }
+    if failures:
+        raise BatchProcessError(failures)
+    return exit_codes
+
+def pool_multiprocess(
+        func,
+        arg_list,
+        n_cores=mp.cpu_count(),
+        initializer=None,
+        initargs=(),
+        show_progress=True,
+        chunksize=1
+    ):
+    """
+    Map `func` over `arg_list` on a pool of `n_cores` persistent worker processes
+    (default: all CPU cores), each set up once by calling `initializer(*initargs)`,
+    yielding the results in the order they complete, with the option to show a
+    progress bar using tqdm (default: shown). Each worker is handed `chunksize`
+    consecutive arguments at a time.
     """
-    iterator = [*chunked(function_list, n_cores)]
-    if show_progress:
-        iterator = tqdm(iterator)
-    for func_batch in iterator:
-        procs = []
-        for f in func_batch:
-            procs.append(Process(target=f))
-        for p in procs:
-            p.start()
-        for p in procs:
-            p.join()
+    with mp.Pool(n_cores, initializer, initargs) as pool:
+        results = pool.imap_unordered(func, arg_list, chunksize)
+        if show_progress:
+            results = tqdm(results, total=len(arg_list))
+        yield from results
 
 def sequential_process(function_list, n_cores=mp.cpu_count(), show_progress=False):
     """
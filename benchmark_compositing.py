@@ -0,0 +1,66 @@
+# Check that `composite_bg_uint8` rounds every (alpha, colour, background) combination
+# exactly and stays within one level of the float `alpha_composite_bg_float`, that
+# `alpha_composite_bg` still gives the float result unless `rounded=True` for images
+# whose maximum is below 255 (which the float version scales by), then time them both
+# on a full-size glyph
+# Usage: python benchmark_compositing.py [size] [n_repeats]
+import sys
+from time import perf_counter
+import numpy as np
+from compositing import alpha_composite_bg, alpha_composite_bg_float, composite_bg_uint8
+
+size = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+n_repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+alpha, colour = np.meshgrid(np.arange(256), np.arange(256), indexing="ij")
+every_pair = np.stack([colour, colour, 255 - colour, alpha], axis=2).astype(np.uint8)
+n_wrong = n_off_by_one = max_diff = 0
+for bg in range(256):
+    composited = composite_bg_uint8(every_pair, bg).astype(int)
+    a = alpha[:, :, None]
+    exact = (a * every_pair[:, :, :3] + (255 - a) * bg + 127) // 255
+    n_wrong += np.count_nonzero(composited != exact)
+    diff = np.abs(composited - alpha_composite_bg_float(every_pair, bg).astype(int))
+    n_off_by_one += np.count_nonzero(diff)
+    max_diff = max(max_diff, diff.max())
+n_values = every_pair[:, :, :3].size * 256
+print(f"{n_values} values, {n_wrong} wrongly rounded")
+print(f"vs float: {n_off_by_one / n_values:.1%} differ (rounded, not truncated), max {max_diff}")
+failed = n_wrong > 0 or max_diff > 1
+
+rng = np.random.default_rng(0)
+# Dim images (maximum below 255), which the float path scales by their maximum
+for im_max in [254, 200, 128, 1]:
+    dim = rng.integers(0, im_max + 1, (64, 64, 4), dtype=np.uint8)
+    dim.flat[0] = im_max
+    float_composited = alpha_composite_bg_float(dim, 127)
+    unchanged = np.array_equal(alpha_composite_bg(dim, 127), float_composited)
+    rounded_diff = np.abs(
+        alpha_composite_bg(dim, 127, rounded=True).astype(int) - float_composited
+    ).max()
+    print(f"max {im_max}: default is float={unchanged}, rounded differs by {rounded_diff}")
+    failed |= not unchanged
+
+rgba = rng.integers(0, 256, (size, size, 4), dtype=np.uint8)
+rgba[:size // 2, :, 3] = 255 # an opaque half, as glyphs have
+bg = 127
+t0 = perf_counter()
+for _ in range(n_repeats):
+    float_composited = alpha_composite_bg_float(rgba, bg)
+t_float = (perf_counter() - t0) / n_repeats
+t0 = perf_counter()
+for _ in range(n_repeats):
+    int_composited = composite_bg_uint8(rgba, bg)
+t_int = (perf_counter() - t0) / n_repeats
+out = np.empty((size, size, 3), dtype=np.uint8)
+t0 = perf_counter()
+for _ in range(n_repeats):
+    composite_bg_uint8(rgba, bg, out=out)
+t_out = (perf_counter() - t0) / n_repeats
+diff = np.abs(float_composited.astype(int) - int_composited.astype(int)).max()
+print(f"{size}x{size} RGBA onto {bg}: max difference {diff}")
+print(f"float: {t_float * 1000:.1f}ms")
+print(f"uint8 fixed-point: {t_int * 1000:.1f}ms ({t_float / t_int:.1f}x)")
+print(f"uint8 fixed-point into a reused buffer: {t_out * 1000:.1f}ms")
+if failed:
+    sys.exit(1)
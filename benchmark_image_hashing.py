@@ -0,0 +1,43 @@
+# Check that the batched hashing in `image_hashing.py` gives hashes identical to the
+# per-image `imagehash` path of the `calculate_hashes.py` scripts, and time them both
+# Usage: python benchmark_image_hashing.py osx/catalina/png [n_pngs]
+import sys
+from pathlib import Path
+from time import perf_counter
+from PIL import Image
+from imagehash import average_hash, colorhash, dhash
+from image_hashing import load_thumbnails, hash_thumbnails
+
+def hash_emoji(img_fname):
+    "Return average/color/diff hashes (lengths 64, 49, 64 respectively)"
+    img = Image.open(img_fname)
+    mini_img = img.resize((32,32))
+    a = average_hash(mini_img, hash_size=16)
+    c = colorhash(mini_img, binbits=14) # must be 14 to get square array
+    d = dhash(mini_img, hash_size=16)
+    return str(a), str(c), str(d)
+
+png_dir = Path(sys.argv[1])
+pngs = sorted(p for p in png_dir.iterdir() if p.is_file() and p.suffix == ".png")
+if len(sys.argv) > 2:
+    pngs = pngs[:int(sys.argv[2])]
+
+t0 = perf_counter()
+imagehash_hashes = [hash_emoji(png) for png in pngs]
+t_imagehash = perf_counter() - t0
+
+t0 = perf_counter()
+thumbs = load_thumbnails(pngs)
+t_load = perf_counter() - t0
+t0 = perf_counter()
+batch_hashes = hash_thumbnails(thumbs)
+t_hash = perf_counter() - t0
+
+mismatches = [
+    png.name for png, h1, h2 in zip(pngs, imagehash_hashes, batch_hashes) if h1 != h2
+]
+print(f"{len(pngs)} PNGs, {len(mismatches)} mismatched: {mismatches[:10]}")
+print(f"imagehash (per image, incl. decoding): {t_imagehash:.2f}s")
+print(f"batched: {t_load:.2f}s decoding + {t_hash:.2f}s hashing")
+if mismatches:
+    sys.exit(1)
@@ -0,0 +1,41 @@
+# Check that `nearest_upscale` gives pixels identical to `tf.resize(..., order=0)` for
+# integer and fractional scale factors, and time and size them both
+# Usage: python benchmark_nearest_upscale.py [in_size] [out_size]
+import sys
+from time import perf_counter
+import numpy as np
+from skimage import transform as tf
+from transform_utils import nearest_upscale
+
+in_size = int(sys.argv[1]) if len(sys.argv) > 1 else 160
+out_size = int(sys.argv[2]) if len(sys.argv) > 2 else 2000 # 12.5x scale
+
+rng = np.random.default_rng(0)
+mismatches = []
+n_cases = 0
+for n_in in [1, 2, 3, 7, 56, 160]:
+    for n_out in [n_in, n_in * 2, n_in * 12 + n_in // 2, 103, 700, 2000]:
+        for channels in [(), (3,)]:
+            img = rng.integers(0, 256, (n_in, n_in + 1, *channels), dtype=np.uint8)
+            shape = (n_out, n_out + 3, *channels)
+            expected = tf.resize(img, shape, order=0, preserve_range=True)
+            upscaled = nearest_upscale(img, shape)
+            n_cases += 1
+            if upscaled.dtype != img.dtype or not np.array_equal(expected, upscaled):
+                mismatches.append((img.shape, shape))
+print(f"{n_cases} cases, {len(mismatches)} mismatched: {mismatches[:10]}")
+
+img = rng.integers(0, 256, (in_size, in_size, 3), dtype=np.uint8)
+shape = (out_size, out_size, 3)
+t0 = perf_counter()
+resized = tf.resize(img, shape, order=0, preserve_range=True)
+t_resize = perf_counter() - t0
+t0 = perf_counter()
+upscaled = nearest_upscale(img, shape)
+t_upscale = perf_counter() - t0
+identical = np.array_equal(resized, upscaled)
+print(f"{in_size} -> {out_size}: {identical=}")
+print(f"tf.resize: {t_resize:.3f}s, {resized.nbytes / 1e6:.0f}MB as {resized.dtype}")
+print(f"nearest_upscale: {t_upscale:.3f}s, {upscaled.nbytes / 1e6:.0f}MB as {upscaled.dtype}")
+if mismatches or not identical:
+    sys.exit(1)
@@ -0,0 +1,54 @@
+# Check that the summed-area `get_neighbour_mask` gives masks identical to the
+# `convolve` one it replaced (including at the reflected boundaries), and time them both.
+# uint8 planes are summed as int64 rather than wrapping as `convolve` sums them, so
+# they're checked against `convolve` on the int64 plane and to differ from it on uint8
+# Usage: python benchmark_neighbour_mask.py [size] [neighbour_dist]
+import sys
+from time import perf_counter
+import numpy as np
+from scipy.ndimage import binary_dilation
+from transform_utils import get_neighbour_mask, get_neighbour_mask_convolve
+
+size = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+neighbour_dist = int(sys.argv[2]) if len(sys.argv) > 2 else 7 # 12.5x scale
+
+rng = np.random.default_rng(0)
+cases = []
+# Glyph-like alpha planes: opaque blobs with soft edges, nearest-neighbour upscaled
+for shape in [(160, 160), (56, 56), (5, 3), (1, 1)]:
+    blobs = rng.random(shape) < 0.6
+    alpha = np.where(binary_dilation(blobs), 255, rng.integers(0, 256, shape))
+    for dist in [0, 1, 2, 7, 13]:
+        cases.append((alpha.astype(int), 255, dist))
+        cases.append((alpha.astype(np.uint8), 255, dist))
+        cases.append((blobs.astype(int), 1, dist))
+# uint8 planes are compared to `convolve` on them as int64, as it would wrap around
+mismatches = [
+    (a.shape, a.dtype, d) for a, m, d in cases if not np.array_equal(
+        get_neighbour_mask(a, m, d), get_neighbour_mask_convolve(a.astype(int), m, d)
+    )
+]
+print(f"{len(cases)} cases, {len(mismatches)} mismatched: {mismatches[:10]}")
+# An opaque uint8 plane: `convolve` wraps its sums, so finds no pixel surrounded by 255
+opaque = np.full((16, 16), 255, dtype=np.uint8)
+wraps = not get_neighbour_mask_convolve(opaque, 255, 1).any()
+summed = get_neighbour_mask(opaque, 255, 1).all()
+print(f"uint8 opaque plane: convolve wraps={wraps}, summed as int64={summed}")
+if not (wraps and summed):
+    mismatches.append((opaque.shape, opaque.dtype, 1))
+
+scale = size // 160 + 1
+source_alpha = np.where(binary_dilation(rng.random((160, 160)) < 0.6), 255, 0)
+alpha = np.kron(source_alpha, np.ones((scale, scale), dtype=int))[:size, :size]
+t0 = perf_counter()
+convolve_mask = get_neighbour_mask_convolve(alpha, 255, neighbour_dist)
+t_convolve = perf_counter() - t0
+t0 = perf_counter()
+table_mask = get_neighbour_mask(alpha, 255, neighbour_dist)
+t_table = perf_counter() - t0
+identical = np.array_equal(convolve_mask, table_mask)
+print(f"{size}x{size}, {neighbour_dist=}: {identical=}")
+print(f"convolve: {t_convolve:.3f}s")
+print(f"summed-area table: {t_table:.3f}s ({t_convolve / t_table:.1f}x)")
+if mismatches or not identical:
+    sys.exit(1)
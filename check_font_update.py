@@ -0,0 +1,71 @@
+# Check the font update scenario of `enlarge_osx_glyphs.py`: after a first run, glyphs
+# whose PNGs change must be re-queued by the manifest and looked up in the glyph cache,
+# so a glyph changed back to pixels seen before is restored from the cache, one changed
+# to new pixels is sent to LIIF, and unchanged glyphs are left alone
+# Usage: python check_font_update.py
+import sys
+from pathlib import Path
+from tempfile import TemporaryDirectory
+import numpy as np
+from PIL import Image
+from glyph_cache import GlyphCache
+from glyph_manifest import JobManifest
+
+model_digest = "0" * 64 # Stands in for the checkpoint's digest
+resolution = "2000,2000"
+
+def draw_glyph(png, shade):
+    Image.fromarray(np.full((16, 16, 3), shade, dtype=np.uint8)).save(png)
+
+def enlarge(input_png, output_png):
+    "Stand in for LIIF: the output records which input bytes it was made from"
+    output_png.write_bytes(b"enlarged " + input_png.read_bytes())
+
+def run(jobs, manifest, cache):
+    """
+    Sync the manifest then restore from the cache as `enlarge_osx_glyphs.py` does,
+    enlarge what's left and cache the outputs. Returns the names sent to "LIIF".
+    """
+    pending = manifest.sync(jobs, check_inputs=True)
+    pending = cache.restore(pending, model_digest, resolution, manifest)
+    for input_png, output_png in pending:
+        enlarge(input_png, output_png)
+        manifest.mark_done(input_png.name, output_png)
+    cache.store_outputs(jobs, model_digest, resolution, manifest.done_names())
+    return sorted(input_png.name for input_png, _ in pending)
+
+with TemporaryDirectory() as tmp:
+    tmp = Path(tmp)
+    png_dir, out_dir = tmp / "png", tmp / "enlarged"
+    png_dir.mkdir()
+    out_dir.mkdir()
+    for i in range(4):
+        draw_glyph(png_dir / f"glyph-{i}.png", 10 * i)
+    # A glyph from an earlier font version, whose enlargement is still cached
+    draw_glyph(png_dir / "old.png", 200)
+    jobs = [(png, out_dir / png.name) for png in sorted(png_dir.iterdir())]
+    manifest = JobManifest(tmp / "manifest.db")
+    cache = GlyphCache(tmp / "cache", max_bytes=2**30)
+    first_run = run(jobs, manifest, cache)
+    (png_dir / "old.png").unlink()
+    jobs = [job for job in jobs if job[0].name != "old.png"]
+    # The font update: glyph-1 reverts to the old pixels, glyph-2 gets new ones
+    draw_glyph(png_dir / "glyph-1.png", 200)
+    draw_glyph(png_dir / "glyph-2.png", 123)
+    cache.hits = cache.misses = 0
+    second_run = run(jobs, manifest, cache)
+    stale = [
+        output_png.name for input_png, output_png in jobs
+        if output_png.read_bytes() != b"enlarged " + input_png.read_bytes()
+    ]
+    print(f"First run enlarged {first_run}")
+    print(f"After the update, enlarged {second_run} (expected ['glyph-2.png'])")
+    print(f"Cache: {cache.hits} hits, {cache.misses} misses (expected 1 and 1)")
+    print(f"Stale outputs: {stale} (expected [])")
+    ok = second_run == ["glyph-2.png"] and (cache.hits, cache.misses) == (1, 1)
+    ok = ok and not stale
+    print("OK" if ok else "FAILED")
+    manifest.close()
+    cache.close()
+if not ok:
+    sys.exit(1)
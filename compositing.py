@@ -0,0 +1,111 @@
+import numpy as np
+from numbers import Integral
+from PIL import Image
+
+__all__ = [
+    "flatten_rgba", "flatten_png", "check_shade", "composite_bg_uint8",
+    "alpha_composite_bg"
+]
+
+def flatten_rgba(rgba, bg_rgb):
+    """
+    Composite an RGBA image array `(h, w, 4)` onto an opaque background colour `bg_rgb`
+    (an `(r, g, b)` triple), returning an opaque RGBA `uint8` array. The result is
+    rounded to the nearest 8-bit value, matching the pixels ImageMagick gives for
+    `convert png -background rgb(r,g,b) -flatten`.
+    """
+    rgb = rgba[..., :3].astype(np.uint32)
+    alpha = rgba[..., 3:].astype(np.uint32)
+    bg = np.asarray(bg_rgb, dtype=np.uint32)
+    flat = np.empty(rgba.shape, dtype=np.uint8)
+    flat[..., :3] = (alpha * rgb + (255 - alpha) * bg + 127) // 255
+    flat[..., 3] = 255
+    return flat
+
+def flatten_png(input_png, output_png, bg_rgb):
+    """
+    Flatten the PNG at `input_png` (in any mode, converted to RGBA as ImageMagick
+    would read it) onto the background colour `bg_rgb` and save it to `output_png`.
+    """
+    with Image.open(input_png) as img:
+        rgba = np.asarray(img.convert("RGBA"))
+    Image.fromarray(flatten_rgba(rgba, bg_rgb)).save(output_png)
+
+def check_shade(background_shade):
+    """
+    Check that `background_shade` is an integer (including NumPy integers, as read
+    from database rows) in [0,255], returning it as an `int`.
+    """
+    if not isinstance(background_shade, Integral):
+        raise TypeError(f"background_shade must be an integer: {background_shade!r}")
+    if not 0 <= background_shade <= 255:
+        raise ValueError(f"background_shade must be in [0,255]: {background_shade}")
+    return int(background_shade)
+
+def composite_bg_uint8(rgba, background_shade, out=None):
+    """
+    Composite a uint8 RGBA image `(h, w, 4)` onto the grayscale `background_shade` in
+    fixed-point integer arithmetic, `(a * c + (255 - a) * bg + 127) // 255` (i.e. rounded
+    to the nearest level), returning the uint8 RGB result. It is written into `out` (an
+    `(h, w, 3)` uint8 array) if given, so repeated calls can reuse one buffer. The sums
+    fit in uint16 and the division by 255 is done with shifts (using `out` as scratch),
+    so the only full-size temporary is one uint16 array, and no background array is
+    made at all.
+    """
+    background_shade = check_shade(background_shade)
+    if rgba.dtype != np.uint8 or rgba.ndim != 3 or rgba.shape[2] != 4:
+        raise TypeError(f"Expected a uint8 RGBA array, got {rgba.dtype} {rgba.shape}")
+    if out is None:
+        out = np.empty((*rgba.shape[:2], 3), dtype=np.uint8)
+    alpha = rgba[:, :, 3:].astype(np.uint16)
+    acc = np.multiply(rgba[:, :, :3], alpha, dtype=np.uint16)
+    alpha ^= 255 # 255 - alpha, for 8-bit values
+    alpha *= background_shade
+    alpha += 127
+    acc += alpha
+    # x // 255 == (x + 1 + (x >> 8)) >> 8 for all x < 65535 (here x <= 255 * 255 + 127),
+    # with x >> 8 (at most 254) held in `out` until it's overwritten with the result
+    np.right_shift(acc, 8, out=out, casting="unsafe")
+    acc += 1
+    acc += out
+    acc >>= 8
+    np.copyto(out, acc, casting="unsafe")
+    return out
+
+def alpha_composite_bg_float(img, background_shade):
+    """
+    Linearly composite an RGBA image against a grayscale background. Image dtype
+    is preserved. Output height/width will match those of `im`, but the alpha
+    channel dimension will be dropped making it only RGB.
+    """
+    background_shade = check_shade(background_shade)
+    im = img.astype(float)
+    bg = background_shade / 255
+    im_max = im.max()
+    im /= im_max # scale im to [0,1]
+    im_rgb = im[:,:,:3]
+    bg_rgb = np.ones_like(im_rgb) * bg
+    # Scale RGB according to A
+    alpha_im = im[:,:,3]
+    alpha_bg = 1 - alpha_im
+    im_rgb *= alpha_im[:,:,None]
+    bg_rgb *= alpha_bg[:,:,None]
+    composited = im_rgb + bg_rgb
+    # Rescale to original range and return to original dtype
+    composited *= im_max
+    composited = composited.astype(img.dtype)
+    return composited
+
+def alpha_composite_bg(img, background_shade, out=None, rounded=False):
+    """
+    Composite an RGBA image against a grayscale background, dropping the alpha channel,
+    by the float computation of `alpha_composite_bg_float`. If `rounded` is True, uint8
+    images instead go through the integer `composite_bg_uint8` (optionally into `out`).
+    This takes the full range to be [0,255] rather than scaling by the image's maximum,
+    and rounds rather than truncates: for images whose maximum is 255 the results
+    differ by at most one level, but for dimmer images they can differ by much more
+    (see `benchmark_compositing.py`).
+    """
+    if rounded and img.dtype == np.uint8:
+        return composite_bg_uint8(img, background_shade, out=out)
+    return alpha_composite_bg_float(img, background_shade)
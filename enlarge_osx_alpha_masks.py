@@ -1,33 +1,95 @@
-from subprocess import call
+from subprocess import CalledProcessError
+from functools import partial
 from pathlib import Path
 from tqdm import tqdm
-from random import shuffle
 from sys import stderr
+from time import perf_counter
+from liif_engine import enlarge_pngs, enlarge_png_subprocess, report_latencies
+from glyph_manifest import JobManifest, run_tracked
+from image_writer import IMAGE_SUFFIXES, INTERMEDIATE
 
 path_to_liif_script = Path("../liif/demo.py").resolve().absolute()
 path_to_model = Path("../liif/rdn-liif.pth").resolve().absolute()
 
+# Load the model once per worker rather than run `demo.py` once per PNG
+USE_PERSISTENT_WORKERS = True
+N_WORKERS = 1
+# Decode each output in square tiles of this side length spread across the workers (to
+# bound their RAM at very large resolutions), or None to decode each output whole
+TILE_SIZE = None
+# Encoding of the enlarged masks (an intermediate artefact, see `enlarge_osx_glyphs.py`)
+# Also store each output as an uncompressed .npy (~12MB per 2000x2000 glyph) for later
+# stages to memory-map and crop without a full decode (see `array_store.py`), e.g.
+# `Path("enlarged_alpha_npy").absolute()`, or None (the default) to write only the outputs
+array_dir = None
+WRITER_OPTIONS = dict(INTERMEDIATE, background=True, array_dir=array_dir)
+
 png_dir = Path("osx/catalina/alpha/").absolute()
 enlarged_glyph_dir = Path("enlarged").absolute()
 out_dir = Path("enlarged_alpha/").absolute()
-pngs = [png_dir / p.name for p in enlarged_glyph_dir.iterdir() if p.suffix == ".png"]
-shuffle(pngs)
+pngs = sorted(
+    png_dir / f"{p.stem}.png" for p in enlarged_glyph_dir.iterdir()
+    if p.suffix in IMAGE_SUFFIXES
+)
+
+out_resolution = "2000,2000"
+
+# Record each mask's progress so a restart resumes only the incomplete jobs
+manifest_path = Path("enlarged_alpha_manifest.db").absolute()
+VERIFY_MANIFEST = False # Re-check all done outputs' checksums (slow)
+# Re-check every input's size and mtime (re-hashing any changed) to re-queue the
+# masks redrawn since they were enlarged, e.g. after a font update (a stat per mask)
+CHECK_INPUTS = False
 
-processed_count = 0
-try:
-    for png in tqdm(pngs):
-        output_png = out_dir / png.name
-        if output_png.exists():
-            continue
-        call([
-            "python", f"{path_to_liif_script}",
-            "--input", f"{png}",
-            "--model", f"{path_to_model}",
-            "--resolution", "2000,2000",
-            "--output", f"{output_png}"
-        ])
-        processed_count += 1
-    print(f"Finished after processing {processed_count} PNGs", file=stderr)
-except KeyboardInterrupt as e:
-    print(f"Aborted while enlarging '{png}' after processing {processed_count} PNGs",
-            file=stderr)
+# Guard the entry point so worker processes can safely re-import this module
+if __name__ == "__main__":
+    manifest = JobManifest(manifest_path)
+    if VERIFY_MANIFEST:
+        print(f"Reset {manifest.verify_outputs()} bad outputs to pending", file=stderr)
+    out_suffix = f".{WRITER_OPTIONS['fmt']}" if USE_PERSISTENT_WORKERS else ".png"
+    pending = manifest.sync([
+        (png, (out_dir / png.name).with_suffix(out_suffix)) for png in pngs
+    ], check_inputs=CHECK_INPUTS)
+    manifest.close()
+    if USE_PERSISTENT_WORKERS:
+        jobs = [(png, output_png, out_resolution) for png, output_png in pending]
+        latencies = {}
+        try:
+            latencies = enlarge_pngs(
+                jobs,
+                n_cores=N_WORKERS,
+                model_path=path_to_model,
+                liif_dir=path_to_liif_script.parent,
+                manifest_path=manifest_path,
+                tile_size=TILE_SIZE,
+                writer_options=WRITER_OPTIONS
+            )
+        except KeyboardInterrupt as e:
+            print(f"Exitting early...", file=stderr)
+        report_latencies(latencies)
+    else:
+        processed_count = 0
+        latencies = {}
+        try:
+            for png, output_png in tqdm(pending):
+                t0 = perf_counter()
+                call_liif = partial(
+                    enlarge_png_subprocess,
+                    png,
+                    resolution=out_resolution,
+                    liif_script=path_to_liif_script,
+                    model_path=path_to_model
+                )
+                try:
+                    run_tracked(manifest_path, png.name, output_png, call_liif)
+                except (CalledProcessError, OSError) as e:
+                    # e.g. `demo.py` exiting non-zero, or without writing the output
+                    print(f"Failed to enlarge '{png}': {e}", file=stderr)
+                    continue
+                latencies[png.name] = perf_counter() - t0
+                processed_count += 1
+            print(f"Finished after processing {processed_count} PNGs", file=stderr)
+        except KeyboardInterrupt as e:
+            print(f"Aborted while enlarging '{png}' after processing {processed_count} PNGs",
+                    file=stderr)
+        report_latencies(latencies)
@@ -1,60 +1,159 @@
-from subprocess import call
+from subprocess import CalledProcessError
 from pathlib import Path
 from tqdm import tqdm
-from random import shuffle
 from sys import stderr
-from batch_multiprocessing import batch_multiprocess
+from time import perf_counter
+from batch_multiprocessing import BatchProcessError, batch_multiprocess
 from functools import partial
+from liif_engine import enlarge_pngs, enlarge_png_subprocess, report_latencies
+from glyph_manifest import JobManifest, file_digest, run_tracked
+from glyph_cache import GlyphCache
+from glyph_dedup import dedup_groups, fan_out, report_groups, representative_jobs
+from image_writer import INTERMEDIATE
 
 path_to_liif_script = Path("../liif/demo.py").resolve().absolute()
 path_to_model = Path("../liif/rdn-liif.pth").resolve().absolute()
 
 USE_MULTI_CORE = True
+# Load the model once per worker rather than run `demo.py` once per PNG
+USE_PERSISTENT_WORKERS = True
+N_WORKERS = 10
+# Glyphs per encoder forward pass (1 to enlarge each glyph on its own), with the
+# implicit decoder's query chunks sized to keep each worker's peak RAM under the cap
+BATCH_SIZE = 1
+MAX_RAM_MB = 4096
+# Decode each output in square tiles of this side length spread across the workers (to
+# bound their RAM at very large resolutions, overriding BATCH_SIZE), or None for whole
+TILE_SIZE = None
+# Encoding of the enlarged glyphs (an intermediate artefact, so a fast PNG compression
+# level), on a background thread so that each glyph's encoding overlaps the next one's
+# inference (with persistent workers). See `image_writer.py` for the options, e.g.
+# `dict(fmt="npy")` for uncompressed arrays, or `FINAL` for the smallest PNGs
+# Also store each output as an uncompressed .npy (~12MB per 2000x2000 glyph) for later
+# stages to memory-map and crop without a full decode (see `array_store.py`), e.g.
+# `Path("enlarged_npy").absolute()`, or None (the default) to write only the outputs
+array_dir = None
+WRITER_OPTIONS = dict(INTERMEDIATE, background=True, array_dir=array_dir)
 
 png_dir = Path("osx/catalina/bg/").absolute()
 out_dir = Path("enlarged/").absolute()
-pngs = [p for p in png_dir.iterdir() if p.suffix == ".png"]
-shuffle(pngs)
+pngs = sorted(p for p in png_dir.iterdir() if p.suffix == ".png")
 
 out_resolution = "2000,2000"
+# Further resolutions to decode from the same encoder pass as `out_resolution` (with
+# persistent workers), each saved to its own directory, e.g.
+# {"512,512": Path("enlarged_512").absolute(), "1024,1024": Path("enlarged_1024").absolute()}
+# (the glyph cache only holds `out_resolution` outputs, so it's skipped in pyramid mode)
+PYRAMID_OUT_DIRS = {}
 
-if USE_MULTI_CORE:
-    liif_calls = []
-    for png in pngs:
-        output_png = out_dir / png.name
-        if output_png.exists():
-            continue
-        call_liif = partial(
-            call,
-            [
-                "python", f"{path_to_liif_script}",
-                "--input", f"{png}",
-                "--model", f"{path_to_model}",
-                "--resolution", out_resolution,
-                "--output", f"{output_png}"
-            ]
-        )
-        liif_calls.append(call_liif)
-    try:
-        batch_multiprocess(liif_calls, n_cores=10)
-    except KeyboardInterrupt as e:
-        print(f"Exitting early...", file=stderr)
-else:
-    processed_count = 0
-    try:
-        for png in tqdm(pngs):
-            output_png = out_dir / png.name
-            if output_png.exists():
-                continue
-            call([
-                "python", f"{path_to_liif_script}",
-                "--input", f"{png}",
-                "--model", f"{path_to_model}",
-                "--resolution", out_resolution,
-                "--output", f"{output_png}"
-            ])
-            processed_count += 1
-        print(f"Finished after processing {processed_count} PNGs", file=stderr)
-    except KeyboardInterrupt as e:
-        print(f"Aborted while enlarging '{png}' after processing {processed_count} PNGs",
-                file=stderr)
+# Record each glyph's progress so a restart resumes only the incomplete jobs
+manifest_path = Path("enlarged_manifest.db").absolute()
+VERIFY_MANIFEST = False # Re-check all done outputs' checksums (slow)
+# Re-check every input's size and mtime (re-hashing any changed) to re-queue the
+# glyphs redrawn since they were enlarged, e.g. after a font update (a stat per glyph)
+CHECK_INPUTS = False
+
+# Reuse the enlargement of any glyph whose PNG bytes, model and resolution are unchanged
+# (e.g. after a font update), keeping the most recently used outputs up to the size cap
+USE_GLYPH_CACHE = True
+cache_dir = Path("enlarged_cache").absolute()
+CACHE_MAX_MB = 16384
+
+# Enlarge only one of each group of glyphs with identical pixels, then copy its output to
+# the rest of the group (also grouping glyphs whose a/c/d hashes and background shades
+# are all identical if the hash database is given, e.g.
+# `Path("osx/catalina/osx_emoji_hashes.db")`)
+USE_DEDUP = True
+dedup_hash_db = None
+
+# Guard the entry point so worker processes can safely re-import this module
+if __name__ == "__main__":
+    manifest = JobManifest(manifest_path)
+    if VERIFY_MANIFEST:
+        print(f"Reset {manifest.verify_outputs()} bad outputs to pending", file=stderr)
+    out_suffix = f".{WRITER_OPTIONS['fmt']}" if USE_PERSISTENT_WORKERS else ".png"
+    all_jobs = [(png, (out_dir / png.name).with_suffix(out_suffix)) for png in pngs]
+    pending = manifest.sync(all_jobs, check_inputs=CHECK_INPUTS)
+    use_cache = USE_GLYPH_CACHE and not PYRAMID_OUT_DIRS
+    if use_cache:
+        cache = GlyphCache(cache_dir, max_bytes=CACHE_MAX_MB * 2**20)
+        model_digest = file_digest(path_to_model)
+        pending = cache.restore(pending, model_digest, out_resolution, manifest)
+    if USE_DEDUP:
+        groups = dedup_groups(pngs, dedup_hash_db)
+        report_groups(groups)
+        n_fanned_out = fan_out(all_jobs, groups, manifest, PYRAMID_OUT_DIRS.values())
+        pending = representative_jobs(manifest.sync(all_jobs), groups)
+    manifest.close()
+    if USE_PERSISTENT_WORKERS:
+        jobs = [(png, output_png, out_resolution) for png, output_png in pending]
+        latencies = {}
+        try:
+            latencies = enlarge_pngs(
+                jobs,
+                n_cores=N_WORKERS if USE_MULTI_CORE else 1,
+                model_path=path_to_model,
+                liif_dir=path_to_liif_script.parent,
+                batch_size=BATCH_SIZE,
+                max_ram_mb=MAX_RAM_MB if BATCH_SIZE > 1 else None,
+                manifest_path=manifest_path,
+                tile_size=TILE_SIZE,
+                pyramid=PYRAMID_OUT_DIRS,
+                writer_options=WRITER_OPTIONS
+            )
+        except KeyboardInterrupt as e:
+            print(f"Exitting early...", file=stderr)
+        report_latencies(latencies)
+    else:
+        liif_calls = []
+        for png, output_png in pending:
+            call_liif = partial(
+                enlarge_png_subprocess,
+                png,
+                resolution=out_resolution,
+                liif_script=path_to_liif_script,
+                model_path=path_to_model
+            )
+            liif_calls.append(
+                partial(run_tracked, manifest_path, png.name, output_png, call_liif)
+            )
+        if USE_MULTI_CORE:
+            try:
+                batch_multiprocess(liif_calls, n_cores=N_WORKERS)
+            except BatchProcessError as e:
+                # The rest of the batch still ran: failed jobs are marked as such in the
+                # manifest, and the done ones are fanned out and cached below
+                failed = [pending[i][0].name for i in sorted(e.failures)]
+                print(f"{e}\nFailed to enlarge {len(failed)} PNGs: {failed}", file=stderr)
+            except KeyboardInterrupt as e:
+                print(f"Exitting early...", file=stderr)
+        else:
+            processed_count = 0
+            latencies = {}
+            try:
+                for (png, output_png), tracked_call in zip(tqdm(pending), liif_calls):
+                    t0 = perf_counter()
+                    try:
+                        tracked_call()
+                    except (CalledProcessError, OSError) as e:
+                        print(f"Failed to enlarge '{png}': {e}", file=stderr)
+                        continue
+                    latencies[png.name] = perf_counter() - t0
+                    processed_count += 1
+                print(f"Finished after processing {processed_count} PNGs", file=stderr)
+            except KeyboardInterrupt as e:
+                print(f"Aborted while enlarging '{png}' after processing {processed_count} PNGs",
+                        file=stderr)
+            report_latencies(latencies)
+    if USE_DEDUP:
+        manifest = JobManifest(manifest_path)
+        n_fanned_out += fan_out(all_jobs, groups, manifest, PYRAMID_OUT_DIRS.values())
+        manifest.close()
+        print(f"Dedup saved {n_fanned_out} LIIF invocations", file=stderr)
+    if use_cache:
+        manifest = JobManifest(manifest_path)
+        done_names = manifest.done_names()
+        cache.store_outputs(all_jobs, model_digest, out_resolution, done_names)
+        manifest.close()
+        cache.report()
+        cache.close()
@@ -0,0 +1,164 @@
+import hashlib
+import os
+import shutil
+import sqlite3
+from pathlib import Path
+from sys import stderr
+from time import time
+from glyph_manifest import atomic_output
+
+__all__ = ["GlyphCache", "cache_key"]
+
+def cache_key(input_png, model_digest, resolution, output_suffix=".png"):
+    """
+    Return the content address of an enlargement: the SHA-256 of the input PNG's
+    bytes, the model checkpoint's digest and the output resolution (so a changed glyph,
+    model or resolution never hits a stale entry, but a renamed glyph still hits), and
+    its output format if not PNG (see `image_writer.py`).
+    """
+    h = hashlib.sha256()
+    h.update(Path(input_png).read_bytes())
+    h.update(model_digest.encode())
+    h.update(str(resolution).encode())
+    if output_suffix != ".png":
+        h.update(output_suffix.encode())
+    return h.hexdigest()
+
+def link_or_copy(src, dst):
+    "Hard-link `src` to `dst` (replacing it), falling back to a copy across filesystems"
+    with atomic_output(dst) as tmp_path:
+        try:
+            os.link(src, tmp_path)
+        except OSError:
+            shutil.copyfile(src, tmp_path)
+
+class GlyphCache:
+    """
+    A content-addressed store of enlarged glyph outputs in `cache_dir` (see
+    `cache_key`), each kept under its output's suffix, bounded to `max_bytes` by
+    evicting the least recently used entries, with an SQLite index recording each
+    entry's suffix, size and last use, and hit/miss statistics.
+    """
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.conn = sqlite3.connect(self.cache_dir / "index.db", timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+        CREATE TABLE IF NOT EXISTS entries
+        (key char(64), size integer, last_used float,
+        Constraint pk_key Primary key(key))
+        """)
+        # Indexes made before non-PNG entries were stored get the column added
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(entries)")}
+        if "suffix" not in columns:
+            self.conn.execute(
+                "ALTER TABLE entries ADD COLUMN suffix varchar(8) DEFAULT '.png'"
+            )
+        self.conn.commit()
+        self.evict() # In case `max_bytes` was lowered since the last run
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+
+    def close(self):
+        self.conn.close()
+
+    def entry_path(self, key, suffix=".png"):
+        return self.cache_dir / key[:2] / f"{key}{suffix}"
+
+    def fetch(self, key, output_png):
+        """
+        Link (or copy) the cached output for `key` into place at `output_png` and
+        return True, or return False on a miss.
+        """
+        row = self.conn.execute(
+            "SELECT size FROM entries WHERE key = ?", (key,)
+        ).fetchone()
+        entry = self.entry_path(key, output_png.suffix)
+        if row is None or not entry.exists():
+            self.misses += 1
+            return False
+        link_or_copy(entry, output_png)
+        with self.conn:
+            self.conn.execute(
+                "UPDATE entries SET last_used = ? WHERE key = ?", (time(), key)
+            )
+        self.hits += 1
+        self.bytes_saved += row[0]
+        return True
+
+    def store(self, key, output_png):
+        "Add the finished `output_png` to the cache as `key`, then evict if over size"
+        entry = self.entry_path(key, output_png.suffix)
+        entry.parent.mkdir(exist_ok=True)
+        link_or_copy(output_png, entry)
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO entries (key, size, last_used, suffix) "
+                "VALUES (?,?,?,?)",
+                (key, entry.stat().st_size, time(), output_png.suffix)
+            )
+        self.evict()
+
+    def total_bytes(self):
+        total_sql = "SELECT COALESCE(SUM(size), 0) FROM entries"
+        return self.conn.execute(total_sql).fetchone()[0]
+
+    def evict(self):
+        "Delete least recently used entries until the cache fits in `max_bytes`"
+        total = self.total_bytes()
+        if total <= self.max_bytes:
+            return
+        evicted = []
+        for key, size, suffix in self.conn.execute(
+            "SELECT key, size, suffix FROM entries ORDER BY last_used"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            self.entry_path(key, suffix).unlink(missing_ok=True)
+            evicted.append((key,))
+            total -= size
+        with self.conn:
+            self.conn.executemany("DELETE FROM entries WHERE key = ?", evicted)
+
+    def restore(self, pending, model_digest, resolution, manifest=None):
+        """
+        Fetch the cached output (if any) of each `(input_png, output_png)` pair in
+        `pending`, marking each hit as done in the `JobManifest` if given. Returns the
+        pairs which missed (still to be enlarged).
+        """
+        missed = []
+        for input_png, output_png in pending:
+            key = cache_key(input_png, model_digest, resolution, output_png.suffix)
+            if self.fetch(key, output_png):
+                if manifest is not None:
+                    manifest.mark_done(input_png.name, output_png)
+            else:
+                missed.append((input_png, output_png))
+        return missed
+
+    def store_outputs(self, jobs, model_digest, resolution, done_names):
+        """
+        Store the output of each `(input_png, output_png)` pair in `jobs` whose job is
+        done (i.e. whose input filename is in `done_names`) and isn't already cached.
+        """
+        for input_png, output_png in jobs:
+            if input_png.name not in done_names:
+                continue
+            key = cache_key(input_png, model_digest, resolution, output_png.suffix)
+            if not self.entry_path(key, output_png.suffix).exists():
+                self.store(key, output_png)
+
+    def report(self, file=stderr):
+        "Print the hit rate and the bytes of enlarged output reused rather than redone"
+        lookups = self.hits + self.misses
+        if not lookups:
+            return
+        print(
+            f"Glyph cache: {self.hits}/{lookups} hits ({self.hits / lookups:.0%}), "
+            f"{self.bytes_saved / 2**20:.1f}MB reused, "
+            f"{self.total_bytes() / 2**20:.1f}MB of {self.max_bytes / 2**20:.0f}MB used",
+            file=file
+        )
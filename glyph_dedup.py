@@ -0,0 +1,110 @@
+import hashlib
+import sqlite3
+import numpy as np
+from pathlib import Path
+from sys import stderr
+from PIL import Image
+from glyph_cache import link_or_copy
+from shade_lookup import load_shades, osx_bw_db
+
+__all__ = [
+    "pixel_digest", "dedup_groups", "representative_jobs", "fan_out", "report_groups"
+]
+
+def pixel_digest(png):
+    """
+    Return the SHA-256 of a PNG's decoded RGBA pixels and size, so that glyphs with
+    identical pixels match even if their PNG encodings differ
+    """
+    with Image.open(png) as img:
+        rgba = np.asarray(img.convert("RGBA"))
+    return hashlib.sha256(f"{rgba.shape}".encode() + rgba.tobytes()).hexdigest()
+
+def dedup_groups(input_pngs, hash_db=None, shade_db=osx_bw_db):
+    """
+    Group the `input_pngs` whose pixels are identical and (if the path to an
+    `osx_hashes` table is given as `hash_db`) whose a/c/d perceptual hashes are all
+    identical, i.e. at zero Hamming distance, and whose background shades (from the
+    `images` table of `shade_db`) are the same. The hashes are of the transparent
+    `png/` glyphs, so the shade must match too for their flattened `bg/` inputs to.
+    Returns a dict of each PNG's filename to its group's list of PNG paths (in the
+    order given, the first being the group's representative).
+    """
+    keys = {png.name: [pixel_digest(png)] for png in input_pngs}
+    if hash_db is not None:
+        shades = load_shades(shade_db)
+        with sqlite3.connect(hash_db) as conn:
+            hash_sql = "SELECT filename, a_hash, c_hash, d_hash FROM osx_hashes"
+            hashes = conn.execute(hash_sql)
+            for filename, *acd in hashes:
+                if filename in keys and filename in shades:
+                    keys[filename].append((shades[filename], *acd))
+    # Merge the groups sharing any key (a PNG may share its pixels with one glyph and
+    # its hashes with another) by union-find, with each group's members in input order
+    parent = {png.name: png.name for png in input_pngs}
+    def find(name):
+        while parent[name] != name:
+            parent[name] = parent[parent[name]]
+            name = parent[name]
+        return name
+    first_with_key = {}
+    for png in input_pngs:
+        for k in keys[png.name]:
+            if k in first_with_key:
+                parent[find(png.name)] = find(first_with_key[k])
+            else:
+                first_with_key[k] = png.name
+    groups = {}
+    for png in input_pngs:
+        groups.setdefault(find(png.name), []).append(png)
+    return {png.name: members for members in groups.values() for png in members}
+
+def representative_jobs(pending, groups):
+    """
+    Filter the `(input_png, output_png)` pairs in `pending` to one per group (the
+    first pending member of each), the rest being fanned out from it once it's done.
+    """
+    seen = set()
+    reps = []
+    for input_png, output_png in pending:
+        group_rep = groups[input_png.name][0].name
+        if group_rep not in seen:
+            seen.add(group_rep)
+            reps.append((input_png, output_png))
+    return reps
+
+def fan_out(jobs, groups, manifest, extra_dirs=()):
+    """
+    Link (or copy) the output of a done member of each group to the outputs of the
+    group's other members which aren't done, marking them as done in the `JobManifest`
+    `manifest`. Returns the number of outputs fanned out (i.e. enlargements saved).
+    The same-named outputs in any `extra_dirs` (e.g. pyramid resolutions) are linked too.
+    """
+    output_of = {input_png.name: output_png for input_png, output_png in jobs}
+    done_names = manifest.done_names()
+    n_fanned_out = 0
+    for members in {id(m): m for m in groups.values()}.values():
+        names = [png.name for png in members if png.name in output_of]
+        done = [name for name in names if name in done_names]
+        if not done:
+            continue
+        for name in names:
+            if name not in done_names:
+                for extra_dir in extra_dirs:
+                    link_or_copy(
+                        Path(extra_dir) / output_of[done[0]].name,
+                        Path(extra_dir) / output_of[name].name
+                    )
+                link_or_copy(output_of[done[0]], output_of[name])
+                manifest.mark_done(name, output_of[name])
+                n_fanned_out += 1
+    return n_fanned_out
+
+def report_groups(groups, file=stderr):
+    "Print how many glyphs share a group, i.e. how many enlargements dedup can save"
+    n_groups = len({id(members) for members in groups.values()})
+    print(
+        f"Dedup: {len(groups)} glyphs in {n_groups} groups "
+        f"(up to {len(groups) - n_groups} LIIF invocations saved)",
+        file=file
+    )
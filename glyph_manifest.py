@@ -0,0 +1,269 @@
+import hashlib
+import os
+import sqlite3
+from contextlib import contextmanager
+from enum import Enum
+from pathlib import Path
+from time import time
+import numpy as np
+from PIL import Image
+
+__all__ = ["JobState", "JobManifest", "atomic_output", "file_digest", "run_tracked"]
+
+class JobState(Enum):
+    pending = "pending"
+    running = "running"
+    done    = "done"
+    failed  = "failed"
+
+def file_digest(path):
+    "Return the SHA-256 hex digest of the file at `path`"
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def is_complete_png(path):
+    "Check that the PNG at `path` exists and all of its chunks are intact"
+    try:
+        with Image.open(path) as img:
+            img.verify()
+    except (OSError, SyntaxError):
+        return False
+    return True
+
+def is_complete_npy(path):
+    "Check that the NPY at `path` exists and holds as many bytes as its header says"
+    try:
+        np.load(path, mmap_mode="r")
+    except (OSError, ValueError):
+        return False
+    return True
+
+def is_complete_qoi(path):
+    "Check that the QOI at `path` exists, with its magic bytes and its end marker"
+    try:
+        with open(path, "rb") as f:
+            magic = f.read(4)
+            f.seek(-8, os.SEEK_END)
+            end = f.read()
+    except OSError:
+        return False
+    return magic == b"qoif" and end == bytes(7) + b"\x01"
+
+def is_complete_output(path):
+    "Check that the output at `path` is complete, according to its format (suffix)"
+    suffix = Path(path).suffix
+    if suffix == ".npy":
+        return is_complete_npy(path)
+    elif suffix == ".qoi":
+        return is_complete_qoi(path)
+    return is_complete_png(path)
+
+@contextmanager
+def atomic_output(output_path):
+    """
+    Yield a temporary path to write `output_path` to, which is renamed into place only
+    once the write has finished (so a killed worker never leaves a truncated file). The
+    temporary file is kept in a hidden `.partial` subdirectory of the output directory
+    (so that it's on the same filesystem but isn't picked up when listing the PNGs).
+    """
+    output_path = Path(output_path)
+    partial_dir = output_path.parent / ".partial"
+    partial_dir.mkdir(exist_ok=True)
+    tmp_path = partial_dir / f"{os.getpid()}-{output_path.name}"
+    try:
+        yield tmp_path
+        os.replace(tmp_path, output_path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+class JobManifest:
+    """
+    A SQLite record of each glyph's enlargement job: its state (see `JobState`), the
+    SHA-256 of its input PNG (with its size and mtime, to spot changes without
+    re-hashing) and (once done) of its output. Each worker process should open its own
+    `JobManifest` on the same `db_path`.
+    """
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+        CREATE TABLE IF NOT EXISTS jobs
+        (input_name tinytext, input_path text, output_path text, state varchar(8),
+        input_sha256 char(64), output_sha256 char(64), error text, updated float,
+        Constraint pk_input Primary key(input_name))
+        """)
+        # Manifests made before the input stat was recorded get the columns added
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(jobs)")}
+        for column in ("input_size", "input_mtime_ns"):
+            if column not in columns:
+                self.conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} int")
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def sync(self, jobs, adopt_existing=True, check_inputs=False):
+        """
+        Register any new `(input_png, output_png)` pairs in `jobs` as pending and reset
+        jobs left running by a crashed worker to pending. A known job whose output path
+        has changed (e.g. a new output format's suffix) is moved to it and reset to
+        pending. Returns the `(input_png, output_png)` pairs of all incomplete jobs
+        (pending or failed) in the order they were first registered, without touching
+        the files of jobs done.
+
+        If `check_inputs` is True (e.g. after a font update), every known job's input
+        is also stat'd and, if its size or mtime has changed, re-hashed and reset to
+        pending if its SHA-256 differs. This is off by default so that a restart doesn't
+        stat thousands of unchanged inputs (only new inputs are read).
+
+        If `adopt_existing` is True (the default), a new job whose output already exists
+        complete (checked according to its format, see `is_complete_output`, e.g. from a
+        run before there was a manifest) is registered as done rather than pending,
+        while a truncated one will be redone.
+        """
+        known_sql = (
+            "SELECT input_name, output_path, input_sha256, input_size, input_mtime_ns "
+            "FROM jobs"
+        )
+        known = {
+            name: (output_path, sha, size, mtime_ns)
+            for name, output_path, sha, size, mtime_ns in self.conn.execute(known_sql)
+        }
+        new_rows = []
+        moved_rows = []
+        changed_rows = []
+        restat_rows = []
+        for input_png, output_png in sorted(jobs):
+            if input_png.name in known:
+                known_output, sha, *known_stat = known[input_png.name]
+                if known_output != str(output_png):
+                    moved_rows.append((
+                        str(output_png), JobState.pending.value, time(), input_png.name
+                    ))
+                if not check_inputs:
+                    continue
+                stat = input_png.stat()
+                input_stat = (stat.st_size, stat.st_mtime_ns)
+                if tuple(known_stat) == input_stat:
+                    continue
+                input_sha = file_digest(input_png)
+                if input_sha == sha:
+                    restat_rows.append((*input_stat, input_png.name))
+                else:
+                    changed_rows.append((
+                        JobState.pending.value, input_sha, *input_stat, time(),
+                        input_png.name
+                    ))
+                continue
+            stat = input_png.stat()
+            input_stat = (stat.st_size, stat.st_mtime_ns)
+            if adopt_existing and is_complete_output(output_png):
+                state, output_sha = JobState.done, file_digest(output_png)
+            else:
+                state, output_sha = JobState.pending, None
+            new_rows.append((
+                input_png.name, str(input_png), str(output_png), state.value,
+                file_digest(input_png), output_sha, time(), *input_stat
+            ))
+        with self.conn:
+            self.conn.executemany("""
+            INSERT INTO jobs
+            (input_name, input_path, output_path, state, input_sha256, output_sha256,
+            updated, input_size, input_mtime_ns)
+            VALUES (?,?,?,?,?,?,?,?,?)
+            """, new_rows)
+            self.conn.executemany("""
+            UPDATE jobs SET output_path = ?, state = ?, output_sha256 = NULL,
+            updated = ? WHERE input_name = ?
+            """, moved_rows)
+            self.conn.executemany("""
+            UPDATE jobs SET state = ?, input_sha256 = ?, output_sha256 = NULL,
+            input_size = ?, input_mtime_ns = ?, updated = ? WHERE input_name = ?
+            """, changed_rows)
+            self.conn.executemany(
+                "UPDATE jobs SET input_size = ?, input_mtime_ns = ? WHERE input_name = ?",
+                restat_rows
+            )
+            self.conn.execute(
+                "UPDATE jobs SET state = ? WHERE state = ?",
+                (JobState.pending.value, JobState.running.value)
+            )
+        wanted = {input_png.name for input_png, _ in jobs}
+        incomplete = self.conn.execute("""
+        SELECT input_name, input_path, output_path FROM jobs
+        WHERE state != ? ORDER BY rowid
+        """, (JobState.done.value,))
+        return [
+            (Path(input_path), Path(output_path))
+            for name, input_path, output_path in incomplete if name in wanted
+        ]
+
+    def verify_outputs(self):
+        """
+        Re-check the checksum of every done job's output, resetting any which are
+        missing or differ to pending (a slow full scan, so only run it when in doubt).
+        Returns the number of jobs reset.
+        """
+        done = self.conn.execute(
+            "SELECT input_name, output_path, output_sha256 FROM jobs WHERE state = ?",
+            (JobState.done.value,)
+        ).fetchall()
+        bad = [
+            (JobState.pending.value, time(), name) for name, output_path, sha in done
+            if not Path(output_path).exists() or file_digest(output_path) != sha
+        ]
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE jobs SET state = ?, updated = ? WHERE input_name = ?", bad
+            )
+        return len(bad)
+
+    def done_names(self):
+        "Return the set of input filenames of the jobs which are done"
+        done = self.conn.execute(
+            "SELECT input_name FROM jobs WHERE state = ?", (JobState.done.value,)
+        )
+        return {name for (name,) in done}
+
+    def mark_running(self, input_names):
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE jobs SET state = ?, updated = ? WHERE input_name = ?",
+                [(JobState.running.value, time(), name) for name in input_names]
+            )
+
+    def mark_done(self, input_name, output_png):
+        "Record a job as done along with the checksum of its (renamed) output"
+        with self.conn:
+            self.conn.execute(
+                "UPDATE jobs SET state = ?, output_sha256 = ?, error = NULL, updated = ? "
+                "WHERE input_name = ?",
+                (JobState.done.value, file_digest(output_png), time(), input_name)
+            )
+
+    def mark_failed(self, input_name, error):
+        with self.conn:
+            self.conn.execute(
+                "UPDATE jobs SET state = ?, error = ?, updated = ? WHERE input_name = ?",
+                (JobState.failed.value, f"{error!r}", time(), input_name)
+            )
+
+def run_tracked(manifest_path, input_name, output_png, write_output):
+    """
+    Run one job in its own process: call `write_output(tmp_path)` to write the output
+    to a temporary path, rename it into place at `output_png` and record the job's
+    progress in the manifest at `manifest_path`. Exceptions are recorded then re-raised.
+    """
+    manifest = JobManifest(manifest_path)
+    manifest.mark_running([input_name])
+    try:
+        with atomic_output(output_png) as tmp_png:
+            write_output(tmp_png)
+    except BaseException as e:
+        manifest.mark_failed(input_name, e)
+        raise
+    else:
+        manifest.mark_done(input_name, output_png)
+    finally:
+        manifest.close()
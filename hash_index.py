@@ -0,0 +1,104 @@
+import numpy as np
+
+__all__ = ["HashIndex", "pack_hex_hashes", "popcount"]
+
+HASH_KINDS = "acd"
+# Each distance is at most 256 bits so fits in 9 bits of a combined (d, c, a) sort key
+DIST_BITS = 9
+DIST_MASK = (1 << DIST_BITS) - 1
+INCOMPATIBLE = np.iinfo(np.int32).max # key for hashes of different shapes
+QUERY_CHUNK = 256 # query rows XOR'd against the whole index at a time
+
+if hasattr(np, "bitwise_count"):
+    def popcount(words):
+        "Count the set bits in each element of a `uint64` array"
+        return np.bitwise_count(words)
+else:
+    BYTE_POPCOUNTS = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def popcount(words):
+        "Count the set bits in each element of a `uint64` array (by a byte lookup table)"
+        as_bytes = words[..., None].view(np.uint8)
+        return BYTE_POPCOUNTS[as_bytes].sum(axis=-1, dtype=np.uint16)
+
+def hash_size(hexstr):
+    "The side length of the bit array `imagehash.hex_to_hash` would unpack `hexstr` to"
+    return int(np.sqrt(len(hexstr) * 4))
+
+def pack_hex_hashes(hex_hashes):
+    """
+    Pack a list of hex hash strings into a `(N, n_words)` array of big-endian `uint64`
+    words (zero padded on the left to the longest hash), along with the `(N,)` array of
+    their hash sizes. Two hashes can only be compared when their sizes are equal, as
+    `ImageHash.__sub__` requires, and their Hamming distance is then the popcount of
+    their words XOR'd together.
+    """
+    sizes = np.array([hash_size(h) for h in hex_hashes], dtype=np.int32)
+    n_words = -(-int(sizes.max(initial=0)) ** 2 // 64)
+    packed = b"".join(int(h, 16).to_bytes(n_words * 8, "big") for h in hex_hashes)
+    words = np.frombuffer(packed, dtype=">u8").astype(np.uint64)
+    return words.reshape(len(hex_hashes), n_words), sizes
+
+class HashIndex:
+    """
+    The a/c/d hashes of a reference table (a DataFrame with `a_hash`, `c_hash` and
+    `d_hash` hex string columns) packed into `uint64` arrays, to compute the Hamming
+    distances of many query hashes against all of them at once.
+    """
+    def __init__(self, df):
+        self.n_rows = len(df)
+        self.packed = {L: pack_hex_hashes(df[f"{L}_hash"].tolist()) for L in HASH_KINDS}
+
+    def distances(self, df):
+        """
+        Return the `(n_query, n_rows)` Hamming distances from each row of the query
+        DataFrame `df` to each row of the index for each hash kind, as a dict keyed by
+        "a", "c" and "d". Pairs of hashes with different shapes get a distance of -1.
+        """
+        dists = {}
+        for L in HASH_KINDS:
+            ref_words, ref_sizes = self.packed[L]
+            q_words, q_sizes = pack_hex_hashes(df[f"{L}_hash"].tolist())
+            n_words = max(ref_words.shape[1], q_words.shape[1])
+            ref_words = np.pad(ref_words, ((0, 0), (n_words - ref_words.shape[1], 0)))
+            q_words = np.pad(q_words, ((0, 0), (n_words - q_words.shape[1], 0)))
+            dist = np.empty((len(df), self.n_rows), dtype=np.int16)
+            for start in range(0, len(df), QUERY_CHUNK):
+                chunk = slice(start, start + QUERY_CHUNK)
+                xor = q_words[chunk, None, :] ^ ref_words[None, :, :]
+                dist[chunk] = popcount(xor).sum(axis=-1)
+            dist[q_sizes[:, None] != ref_sizes[None, :]] = -1
+            dists[L] = dist
+        return dists
+
+    def sort_keys(self, df):
+        """
+        Return the `(n_query, n_rows)` matrix of distances combined into one integer
+        key per pair that orders lexicographically by (d, c, a) distance, so that the
+        nearest rows are those with the minimum key. Incompatible pairs (whose hashes
+        have different shapes) get the key `INCOMPATIBLE`, greater than any other.
+        """
+        dists = self.distances(df)
+        a, c, d = [dists[L].astype(np.int32) for L in HASH_KINDS]
+        keys = (d << (2 * DIST_BITS)) | (c << DIST_BITS) | a
+        keys[(a < 0) | (c < 0) | (d < 0)] = INCOMPATIBLE
+        return keys
+
+    @staticmethod
+    def nearest(key_row, candidates=None):
+        """
+        Given one query's row of `sort_keys`, return the indices of the nearest rows
+        by (d, c, a) distance among the boolean mask `candidates` (default: all rows),
+        in index order including all ties, along with their `(a, c, d)` distances. If
+        there are no compatible candidates the list of indices is empty.
+        """
+        if candidates is None:
+            candidates = np.ones(len(key_row), dtype=bool)
+        masked = np.where(candidates, key_row, INCOMPATIBLE)
+        best = masked.min(initial=INCOMPATIBLE)
+        if best == INCOMPATIBLE:
+            return [], None
+        dists = tuple(
+            int(best >> (i * DIST_BITS)) & DIST_MASK for i in range(len(HASH_KINDS))
+        )
+        return np.flatnonzero(masked == best).tolist(), dists
@@ -0,0 +1,169 @@
+import math
+import numpy as np
+from PIL import Image
+
+__all__ = ["load_thumbnails", "hash_thumbnails", "hash_pngs"]
+
+# Fixed point precision of Pillow's 8-bit resampling coefficients (see `Resample.c`)
+PRECISION_BITS = 32 - 8 - 2
+HEX_DIGITS = np.array([*"0123456789abcdef"])
+
+def load_thumbnails(pngs, size=(32,32)):
+    """
+    Decode each PNG and resize it to `size` exactly as `hash_emoji` does (by Pillow's
+    default resampling filter), returning an RGB array of shape `(N, h, w, 3)`. Alpha
+    is dropped, as the `imagehash` functions' greyscale and HSV conversions drop it.
+    """
+    thumbs = np.empty((len(pngs), size[1], size[0], 3), dtype=np.uint8)
+    for i, png in enumerate(pngs):
+        with Image.open(png) as img:
+            thumbs[i] = np.asarray(img.resize(size).convert("RGB"))
+    return thumbs
+
+def rgb_to_l(rgb):
+    "Convert RGB to greyscale by Pillow's fixed point ITU-R 601-2 luma transform"
+    r, g, b = [rgb[..., i].astype(np.int32) for i in range(3)]
+    return ((r * 19595 + g * 38470 + b * 7471 + 0x8000) >> 16).astype(np.uint8)
+
+def rgb_to_hue_saturation(rgb):
+    """
+    Convert RGB to the hue and saturation channels of Pillow's HSV mode, repeating its
+    mix of single and double precision arithmetic so that rounding matches exactly.
+    """
+    r, g, b = [rgb[..., i] for i in range(3)]
+    maxc = rgb.max(axis=-1)
+    minc = rgb.min(axis=-1)
+    grey = maxc == minc
+    cr = np.where(grey, 1, maxc.astype(np.float32) - minc).astype(np.float32)
+    s = cr / np.where(grey, 1, maxc).astype(np.float32)
+    rc, gc, bc = [(maxc.astype(np.float32) - c) / cr for c in (r, g, b)]
+    h = np.where(
+        r == maxc,
+        bc - gc,
+        np.where(
+            g == maxc,
+            (2.0 + rc.astype(np.float64) - bc).astype(np.float32),
+            (4.0 + gc.astype(np.float64) - rc).astype(np.float32)
+        )
+    )
+    h = np.fmod(h.astype(np.float64) / 6.0 + 1.0, 1.0).astype(np.float32)
+    hue = np.clip((h.astype(np.float64) * 255.0).astype(np.int64), 0, 255)
+    sat = np.clip((s.astype(np.float64) * 255.0).astype(np.int64), 0, 255)
+    return np.where(grey, 0, hue), np.where(grey, 0, sat)
+
+def lanczos(x):
+    def sinc(x):
+        return 1.0 if x == 0.0 else math.sin(x * math.pi) / (x * math.pi)
+    return sinc(x) * sinc(x / 3) if -3.0 <= x < 3.0 else 0.0
+
+def lanczos_coefficients(in_size, out_size):
+    """
+    Compute Pillow's fixed point Lanczos (`Image.LANCZOS`) resampling coefficients
+    for `in_size` to `out_size` pixels, as an `(out_size, in_size)` matrix.
+    """
+    scale = in_size / out_size
+    filterscale = max(scale, 1.0)
+    support = 3.0 * filterscale
+    ss = 1.0 / filterscale
+    coefficients = np.zeros((out_size, in_size), dtype=np.int64)
+    for xx in range(out_size):
+        center = (xx + 0.5) * scale
+        xmin = max(int(center - support + 0.5), 0)
+        xmax = min(int(center + support + 0.5), in_size)
+        weights = [lanczos((x - center + 0.5) * ss) for x in range(xmin, xmax)]
+        total = 0.0
+        for w in weights:
+            total += w
+        if total != 0.0:
+            weights = [w / total for w in weights]
+        coefficients[xx, xmin:xmax] = [
+            int((-0.5 if w < 0 else 0.5) + w * (1 << PRECISION_BITS)) for w in weights
+        ]
+    return coefficients
+
+def clip8(acc):
+    "Round and clip fixed point accumulators back to 8-bit values as Pillow does"
+    return np.clip((acc + (1 << (PRECISION_BITS - 1))) >> PRECISION_BITS, 0, 255)
+
+def resize_l(l_imgs, size):
+    """
+    Resize a batch of greyscale images `(N, h, w)` to `size` (w, h) with Lanczos
+    resampling, bit-identically to `Image.resize(size, Image.LANCZOS)` on each image
+    (a horizontal pass then a vertical pass, each rounded back to 8 bits).
+    """
+    out_w, out_h = size
+    in_h, in_w = l_imgs.shape[1:]
+    horizontal = clip8(l_imgs.astype(np.int64) @ lanczos_coefficients(in_w, out_w).T)
+    return clip8(lanczos_coefficients(in_h, out_h) @ horizontal)
+
+def bits_to_hex(bits):
+    """
+    Convert a batch of bit arrays `(N, n_bits)` to hex strings, as `str(ImageHash)`
+    does (the bit string as a zero-padded hex integer).
+    """
+    n, n_bits = bits.shape
+    padded = np.zeros((n, -(-n_bits // 4) * 4), dtype=np.uint8)
+    padded[:, padded.shape[1] - n_bits:] = bits
+    nibbles = padded.reshape(n, -1, 4) @ np.array([8, 4, 2, 1], dtype=np.uint8)
+    return ["".join(row) for row in HEX_DIGITS[nibbles]]
+
+def average_hashes(l_imgs, hash_size=16):
+    "Batched equivalent of `imagehash.average_hash` on greyscale images"
+    pixels = resize_l(l_imgs, (hash_size, hash_size)).reshape(len(l_imgs), -1)
+    return bits_to_hex(pixels > pixels.mean(axis=1, keepdims=True))
+
+def difference_hashes(l_imgs, hash_size=16):
+    "Batched equivalent of `imagehash.dhash` on greyscale images"
+    pixels = resize_l(l_imgs, (hash_size + 1, hash_size))
+    diff = pixels[:, :, 1:] > pixels[:, :, :-1]
+    return bits_to_hex(diff.reshape(len(l_imgs), -1))
+
+def colour_hashes(rgb_imgs, l_imgs, binbits=14):
+    "Batched equivalent of `imagehash.colorhash` on RGB images"
+    n = len(rgb_imgs)
+    intensity = l_imgs.reshape(n, -1)
+    h, s = [c.reshape(n, -1) for c in rgb_to_hue_saturation(rgb_imgs)]
+    mask_black = intensity < 256 // 8
+    frac_black = mask_black.mean(axis=1)
+    mask_gray = s < 256 // 3
+    frac_gray = (~mask_black & mask_gray).mean(axis=1)
+    mask_colors = ~mask_black & ~mask_gray
+    mask_faint_colors = mask_colors & (s < 256 * 2 // 3)
+    mask_bright_colors = mask_colors & (s > 256 * 2 // 3)
+    c = np.maximum(1, mask_colors.sum(axis=1))
+    hue_bins = np.linspace(0, 255, 6 + 1)
+    n_bins = len(hue_bins) - 1
+    hue_idx = np.minimum(np.searchsorted(hue_bins, h, side="right") - 1, n_bins - 1)
+    # Offset each image's bin indices so one bincount histograms the whole batch
+    offset_idx = hue_idx + (np.arange(n) * n_bins)[:, None]
+    h_faint_counts, h_bright_counts = [
+        np.bincount(offset_idx[mask], minlength=n * n_bins).reshape(n, n_bins)
+        for mask in (mask_faint_colors, mask_bright_colors)
+    ]
+    maxvalue = 2**binbits
+    counts = np.hstack([h_faint_counts, h_bright_counts])
+    values = np.hstack([
+        (frac_black * maxvalue).astype(np.int64)[:, None],
+        (frac_gray * maxvalue).astype(np.int64)[:, None],
+        (counts * maxvalue * 1. / c[:, None]).astype(np.int64)
+    ])
+    values = np.minimum(maxvalue - 1, values)
+    i = np.arange(binbits)
+    bits = (values[:, :, None] // 2**(binbits - i - 1)) % 2**(binbits - i) > 0
+    return bits_to_hex(bits.reshape(n, -1))
+
+def hash_thumbnails(thumbs):
+    """
+    Return the average/colour/difference hash hex strings (lengths 64, 49, 64) of
+    every thumbnail in the `(N, 32, 32, 3)` batch `thumbs`, as a list of tuples
+    identical to those `hash_emoji` gives via `imagehash` for each image in turn.
+    """
+    l_imgs = rgb_to_l(thumbs)
+    a = average_hashes(l_imgs)
+    c = colour_hashes(thumbs, l_imgs)
+    d = difference_hashes(l_imgs)
+    return [*zip(a, c, d)]
+
+def hash_pngs(pngs):
+    "Load and hash a batch of PNGs in one go (see `hash_thumbnails`)"
+    return hash_thumbnails(load_thumbnails(pngs))
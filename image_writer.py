@@ -0,0 +1,171 @@
+import struct
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from threading import BoundedSemaphore
+import numpy as np
+from PIL import Image
+from imageio import imread
+from array_store import ArrayStore
+from glyph_manifest import atomic_output
+
+__all__ = [
+    "ImageWriter", "write_image", "read_image", "encode_png",
+    "IMAGE_SUFFIXES", "INTERMEDIATE", "FINAL"
+]
+
+# The formats an image can be written in: PNG, uncompressed NumPy array, or QOI (which
+# needs the `qoi` package) for fast-to-write intermediate artefacts
+IMAGE_SUFFIXES = (".png", ".npy", ".qoi")
+
+# PNG scanline filter types (for every row), besides "adaptive" (Pillow's per-row choice)
+PNG_FILTERS = {"none": 0, "sub": 1, "up": 2}
+ZLIB_STRATEGIES = {
+    "default": zlib.Z_DEFAULT_STRATEGY,
+    "filtered": zlib.Z_FILTERED,
+    "huffman": zlib.Z_HUFFMAN_ONLY,
+    "rle": zlib.Z_RLE,
+}
+# PNG colour type of each number of channels (grey, grey+alpha, RGB, RGBA)
+PNG_COLOUR_TYPES = {1: 0, 2: 4, 3: 2, 4: 6}
+
+# Encoding options for intermediate artefacts (fast, somewhat bigger) and for final
+# deliverables (as small as zlib gets them, slowly)
+INTERMEDIATE = dict(fmt="png", level=1, png_filter="up", strategy="default")
+FINAL = dict(fmt="png", level=9, png_filter="adaptive", strategy="default")
+
+def filter_scanlines(img, png_filter):
+    "Return the uint8 `(h, 1 + row bytes)` array of filtered PNG scanlines of `img`"
+    h = img.shape[0]
+    channels = 1 if img.ndim == 2 else img.shape[2]
+    rows = img.reshape(h, -1)
+    filtered = np.empty((h, rows.shape[1] + 1), dtype=np.uint8)
+    filtered[:, 0] = PNG_FILTERS[png_filter]
+    if png_filter == "sub":
+        # Each byte minus the same channel of the pixel to its left (modulo 256)
+        filtered[:, 1:1 + channels] = rows[:, :channels]
+        np.subtract(
+            rows[:, channels:], rows[:, :-channels], out=filtered[:, 1 + channels:]
+        )
+    elif png_filter == "up":
+        # Each byte minus the same byte of the row above (modulo 256)
+        filtered[0, 1:] = rows[0]
+        np.subtract(rows[1:], rows[:-1], out=filtered[1:, 1:])
+    else:
+        filtered[:, 1:] = rows
+    return filtered
+
+def png_chunk(tag, data):
+    crc = zlib.crc32(tag + data)
+    return struct.pack("!L", len(data)) + tag + data + struct.pack("!L", crc)
+
+def encode_png(img, level=6, png_filter="up", strategy="default"):
+    """
+    Encode a uint8 `(h, w)` or `(h, w, channels)` array as PNG bytes, applying the same
+    scanline filter (see `PNG_FILTERS`) to every row, vectorised with NumPy rather than
+    chosen row by row as Pillow does, and deflating with the zlib `level` and `strategy`
+    (see `ZLIB_STRATEGIES`).
+    """
+    h, w = img.shape[:2]
+    channels = 1 if img.ndim == 2 else img.shape[2]
+    header = struct.pack("!LLBBBBB", w, h, 8, PNG_COLOUR_TYPES[channels], 0, 0, 0)
+    strategy = ZLIB_STRATEGIES[strategy]
+    compressor = zlib.compressobj(
+        level, zlib.DEFLATED, zlib.MAX_WBITS, zlib.DEF_MEM_LEVEL, strategy
+    )
+    filtered = filter_scanlines(img, png_filter)
+    idat = compressor.compress(filtered) + compressor.flush()
+    return b"".join([
+        b"\x89PNG\r\n\x1a\n",
+        png_chunk(b"IHDR", header),
+        png_chunk(b"IDAT", idat),
+        png_chunk(b"IEND", b""),
+    ])
+
+def write_image(
+        img, output_path, fmt="png", level=6, png_filter="adaptive", strategy="default"
+    ):
+    """
+    Write the uint8 array `img` to `output_path` (via a temporary file, see
+    `atomic_output`) as a `fmt` file (see `IMAGE_SUFFIXES`). A PNG's zlib `level` and
+    `strategy` and its scanline filter (see `PNG_FILTERS`) are selectable: the default
+    "adaptive" filter at level 6 gives the same PNG as `Image.save` (and `demo.py`).
+    """
+    with atomic_output(output_path) as tmp_path:
+        if fmt == "npy":
+            with open(tmp_path, "wb") as f:
+                np.save(f, img)
+        elif fmt == "qoi":
+            import qoi
+            Path(tmp_path).write_bytes(qoi.encode(np.ascontiguousarray(img)))
+        elif png_filter == "adaptive":
+            # Pillow picks its own strategy to suit its filtering by default (-1)
+            compress_type = -1 if strategy == "default" else ZLIB_STRATEGIES[strategy]
+            Image.fromarray(img).save(
+                tmp_path, format="PNG", compress_level=level, compress_type=compress_type
+            )
+        else:
+            Path(tmp_path).write_bytes(encode_png(img, level, png_filter, strategy))
+
+def read_image(path):
+    "Read an image written by `write_image` (in any of `IMAGE_SUFFIXES`) as an array"
+    path = Path(path)
+    if path.suffix == ".npy":
+        return np.load(path)
+    elif path.suffix == ".qoi":
+        import qoi
+        return qoi.read(str(path))
+    return imread(path)
+
+class ImageWriter:
+    """
+    Write images with the given encoding options (see `write_image`), on a background
+    thread if `background` is True so that each image's encoding overlaps whatever the
+    caller computes next (zlib and Pillow release the GIL while encoding), with at most
+    `max_pending` images held in memory awaiting their turn. If an `array_dir` is given,
+    each image is also saved there to be memory-mapped by later stages (see
+    `ArrayStore`).
+    """
+    def __init__(
+            self,
+            fmt="png",
+            level=6,
+            png_filter="adaptive",
+            strategy="default",
+            background=False,
+            max_pending=2,
+            array_dir=None
+        ):
+        self.options = dict(
+            fmt=fmt, level=level, png_filter=png_filter, strategy=strategy
+        )
+        self.suffix = f".{fmt}"
+        self.executor = ThreadPoolExecutor(1) if background else None
+        self.slots = BoundedSemaphore(max_pending)
+        self.array_store = None if array_dir is None else ArrayStore(array_dir)
+
+    def submit(self, img, output_path):
+        """
+        Write `img` to `output_path`, returning a `Future` which is done once it's in
+        place (already done unless writing in the background, and the writes are made
+        in the order they're submitted). Blocks while `max_pending` writes are queued.
+        """
+        if self.executor is None:
+            future = Future()
+            future.set_result(self.write(img, output_path))
+            return future
+        self.slots.acquire()
+        future = self.executor.submit(self.write, img, output_path)
+        future.add_done_callback(lambda _: self.slots.release())
+        return future
+
+    def write(self, img, output_path):
+        write_image(img, output_path, **self.options)
+        if self.array_store is not None:
+            self.array_store.save(img, output_path)
+        return output_path
+
+    def close(self):
+        "Wait for any writes still running in the background"
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
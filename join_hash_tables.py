@@ -2,12 +2,11 @@ import sqlite3
 from tqdm import tqdm
 from pathlib import Path
 import pandas as pd
-from imagehash import hex_to_hash
-import warnings
 from operator import and_ as bitwise_and
 from functools import reduce
 from sys import stderr
 from enum import Enum
+from hash_index import HashIndex
 
 result_db = "matches.db"
 osx_db = Path("osx/catalina/osx_emoji_hashes.db")
@@ -40,10 +39,13 @@ def write_result_to_db(glyph, glyph_dict):
             c.execute("INSERT INTO top_hash_matches VALUES (?,?,?,?,?,?)", values)
         conn.commit()
 
-def fetch_sql_query(conn, sql_query, query_variable):
-    c = conn.cursor()
-    c.execute(sql_query, query_variable)
-    return c.fetchone() # `None` if no matching result or a single row tuple
+def normalise_codepoint_part(codepoint_part, joiner="-"):
+    "Convert an OS X glyph's codepoint part (e.g. `u1F468_u1F4BB`) to emojipedia's style"
+    return codepoint_part.replace("_u", joiner).replace("u", "").lower()
+
+def suffix_codepoint(codepoint):
+    "Give an emojipedia codepoint the \".0\" suffix of skin tone variant glyphs"
+    return (codepoint + ".0").replace("-fe0f.0", ".0")
 
 def record_match(hit, glyph, glyph_dict):
     "Store and then write to database in next pass through `osx_df` rows"
@@ -226,48 +228,38 @@ def attempt_singular_assignment(glyph, glyph_dict):
             glyph_dict.clear()
             glyph_dict.update(proposed_dict)
 
+# Index the emojipedia rows by codepoint once (keeping the first row of any duplicates)
+ejp_by_codepoint = {}
+ejp_by_suffixed_codepoint = {}
+for ejp_row in ejp_df.itertuples(index=False, name=None):
+    codepoint = ejp_row[ejp_df.columns.get_loc("codepoint")]
+    ejp_by_codepoint.setdefault(codepoint, ejp_row)
+    ejp_by_suffixed_codepoint.setdefault(suffix_codepoint(codepoint), ejp_row)
+
 codepoint_matched_glyphs = {}
 codepoint_matched_ejp_filenames = []
-for i, osx_row in tqdm(osx_df.iterrows(), total=osx_df.shape[0]):
-    glyph = osx_row.filename
+osx_codepoint_parts = zip(osx_df.filename, osx_df.codepoint_part)
+for glyph, codepoint_part in tqdm(osx_codepoint_parts, total=osx_df.shape[0]):
     glyph_dict = {}
-    with sqlite3.connect(emojipedia_db) as ejp_conn:
-        variable_codepoint_part = (osx_row.codepoint_part,)
-        hit = fetch_sql_query(ejp_conn, """
-        SELECT * FROM emojipedia_hashes
-        WHERE LOWER(REPLACE(REPLACE(?, "_u", "-"), "u", "")) == codepoint
-        """, variable_codepoint_part)
-        if hit:
-            record_match(hit, glyph, glyph_dict)
-            continue
-        # Otherwise try again with the ".0" suffix for skin tone variant emojis
-        hit = fetch_sql_query(ejp_conn, """
-        SELECT * FROM emojipedia_hashes
-        WHERE LOWER(REPLACE(REPLACE(?, "_u", "-"), "u", "")) == REPLACE(codepoint || ".0", "-fe0f.0", ".0")
-        """, variable_codepoint_part)
+    # Try the codepoints as they are, then with the "-200d" zero width joiner, in each
+    # case first exactly then with the ".0" suffix for skin tone variant emojis
+    for joiner in ("-", "-200d-"):
+        normalised = normalise_codepoint_part(codepoint_part, joiner)
+        hit = ejp_by_codepoint.get(normalised) or ejp_by_suffixed_codepoint.get(normalised)
         if hit:
             record_match(hit, glyph, glyph_dict)
-            continue
-        # Otherwise try again with the "-200d" zero width joiner
-        hit = fetch_sql_query(ejp_conn, """
-        SELECT * FROM emojipedia_hashes
-        WHERE LOWER(REPLACE(REPLACE(?, "_u", "-200d-"), "u", "")) == codepoint
-        """, variable_codepoint_part)
-        if hit:
-            record_match(hit, glyph, glyph_dict)
-            continue
-        # Otherwise try again with both the ZWJ and the ".0" suffix
-        hit = fetch_sql_query(ejp_conn, """
-        SELECT * FROM emojipedia_hashes
-        WHERE LOWER(REPLACE(REPLACE(?, "_u", "-200d-"), "u", "")) == REPLACE(codepoint || ".0", "-fe0f.0", ".0")
-        """, variable_codepoint_part)
-        if hit:
-            record_match(hit, glyph, glyph_dict)
-            continue
+            break
 
 with open("codepoint_matched_ejp_filenames.txt", "w") as f:
     f.writelines([f"{l}\n" for l in codepoint_matched_ejp_filenames])
 
+# Score every glyph's hashes against every emojipedia icon's at once: each row of
+# `osx_sort_keys` orders the icons by their (d, c, a) hash distances from that glyph
+ejp_index = HashIndex(ejp_df)
+osx_sort_keys = ejp_index.sort_keys(osx_df)
+# Do not score emojipedia icons already matched by codepoint
+unmatched_ejp_mask = ~ejp_df.filename.isin(codepoint_matched_ejp_filenames).to_numpy()
+
 uncertain_glyph_dicts = {}
 n_rows = osx_df.shape[0]
 pbar = tqdm(total=n_rows)
@@ -283,9 +275,6 @@ while idx_row < n_rows:
         glyph_dict = codepoint_matched_glyphs.get(glyph)
     else:
         glyph_dict = {}
-        with warnings.catch_warnings():
-            warnings.simplefilter("ignore")
-            oah, och, odh = [hex_to_hash(osx_row.get(f"{L}_hash")) for L in "acd"]
         glyph_codepoints = glyph[glyph.find("u"):glyph.find(".")].split("_")
         matchable_codepts = [
             p[3:].lower() if p.startswith("u00") else p.lstrip("u").lower()
@@ -324,41 +313,12 @@ while idx_row < n_rows:
                 continue
             else:
                 uncertain_glyph_dicts.update({glyph: pre_hash_glyph_dict})
-        for i, ejp_row in ejp_df[idx_filter].iterrows():
-            ejp_filename = ejp_row.filename
-            if ejp_filename in codepoint_matched_ejp_filenames:
-                continue # do not score emojipedia icons already matched by codepoint
-            with warnings.catch_warnings():
-                warnings.simplefilter("ignore")
-                eah, ech, edh = [hex_to_hash(ejp_row.get(f"{L}_hash")) for L in "acd"]
-                #ech = hex_to_flathash(ejp_row.get("c_hash")) # unsure if needed yet
-            oah_s, och_s, odh_s = [v.hash.shape for v in (oah, och, odh)]
-            eah_s, ech_s, edh_s = [v.hash.shape for v in (eah, ech, edh)]
-            if oah_s != eah_s or och_s != ech_s or odh_s != edh_s:
-                continue # hex strings are not of comparable hash shapes so don't even try
-            dist_a = oah - eah
-            dist_c = och - ech
-            dist_d = odh - edh
-            if glyph_dict:
-                set_to_update = False
-                keys_to_delete = []
-                for gly_k, gly_v in glyph_dict.items():
-                    gly_a, gly_c, gly_d = [gly_v.get(f"{L}_dist") for L in "acd"]
-                    if (dist_d, dist_c, dist_a) < (gly_d, gly_c, gly_a):
-                        # Delete any (potentially multiple same score) more distant glyphs
-                        keys_to_delete.append(gly_k)
-                        set_to_update = True
-                    elif (dist_d, dist_c, dist_a) == (gly_d, gly_c, gly_a):
-                        # This glyph is just as good but no better so add it as well
-                        set_to_update = True
-                # Delete and update if needed, after iteration through the dict items
-                for gly_k in keys_to_delete:
-                    #print(f"Deleting {gly_k} as {ejp_filename} scored better")
-                    del glyph_dict[gly_k]
-                if set_to_update:
-                    dist_dict = {"a_dist": dist_a, "c_dist": dist_c, "d_dist": dist_d}
-                    glyph_dict.update({ejp_filename: dist_dict})
-            else:
+        # Keep every icon tied for the nearest hashes (comparing only same shape hashes)
+        candidates = idx_filter.to_numpy() & unmatched_ejp_mask
+        nearest_idx, nearest_dists = HashIndex.nearest(osx_sort_keys[idx_row], candidates)
+        if nearest_idx:
+            dist_a, dist_c, dist_d = nearest_dists
+            for ejp_filename in ejp_df.filename.iloc[nearest_idx]:
                 dist_dict = {"a_dist": dist_a, "c_dist": dist_c, "d_dist": dist_d}
                 glyph_dict.update({ejp_filename: dist_dict})
     if glyph_dict:
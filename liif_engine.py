@@ -0,0 +1,664 @@
+import sys
+from pathlib import Path
+from sys import stderr
+from time import perf_counter
+from functools import partial
+import numpy as np
+from PIL import Image
+from more_itertools import chunked
+from subprocess import check_call
+from batch_multiprocessing import pool_multiprocess
+from glyph_manifest import JobManifest
+from image_writer import ImageWriter
+
+__all__ = [
+    "load_model", "enlarge_png", "enlarge_png_batch", "enlarge_png_stream",
+    "enlarge_png_subprocess", "enlarge_pngs", "report_latencies"
+]
+
+path_to_liif = Path("../liif/").resolve().absolute()
+path_to_model = path_to_liif / "rdn-liif.pth"
+
+# Number of query coordinates decoded per forward pass of the implicit decoder
+# (the same batch size `demo.py` passes to `batched_predict`)
+QUERY_BATCH_SIZE = 30000
+# Total width of the 4 hidden layers of the decoder MLP in the RDN-LIIF config, and the
+# fewest query coordinates worth decoding per pass when fitting under a RAM cap
+DECODER_HIDDEN_UNITS = 4 * 256
+MIN_QUERY_CHUNK = 1000
+# Side length of the square output tiles decoded one at a time in tiled mode
+TILE_SIZE = 1024
+# Glyphs per pool task when writing in the background, so that each glyph's encoding
+# overlaps the next one's inference (all of a task's writes finish before it returns)
+STREAM_CHUNK_SIZE = 8
+
+def import_liif(liif_dir=path_to_liif):
+    """
+    Put the LIIF repo (default: the sibling `../liif/` directory) on the import path
+    and return its `models` and `utils` modules.
+    """
+    if str(liif_dir) not in sys.path:
+        sys.path.insert(0, str(liif_dir))
+    import models
+    import utils
+    return models, utils
+
+def load_model(model_path=path_to_model, liif_dir=path_to_liif, device=None):
+    """
+    Load the LIIF checkpoint at `model_path` once, ready to be reused for any number
+    of glyphs. The device defaults to CUDA if available, otherwise the CPU.
+    """
+    import torch
+    models, _ = import_liif(liif_dir)
+    if device is None:
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+    model_spec = torch.load(model_path, map_location=device)["model"]
+    model = models.make(model_spec, load_sd=True).to(device)
+    model.eval()
+    return model
+
+def parse_resolution(resolution):
+    "Parse a `demo.py` style resolution string `'h,w'` into a tuple of ints"
+    h, w = map(int, resolution.split(","))
+    return h, w
+
+def make_query_grid(resolution, device, liif_dir=path_to_liif):
+    "Return the flattened coordinate and cell tensors to query an `(h, w)` output"
+    import torch
+    _, utils = import_liif(liif_dir)
+    h, w = resolution
+    coord = utils.make_coord((h, w)).to(device)
+    cell = torch.ones_like(coord)
+    cell[:, 0] *= 2 / h
+    cell[:, 1] *= 2 / w
+    return coord, cell
+
+def split_tiles(resolution, tile_size=TILE_SIZE):
+    "Split an `(h, w)` output into `((y0, y1), (x0, x1))` tiles of at most `tile_size`"
+    h, w = resolution
+    return [
+        ((y, min(y + tile_size, h)), (x, min(x + tile_size, w)))
+        for y in range(0, h, tile_size) for x in range(0, w, tile_size)
+    ]
+
+def make_tile_query_grid(resolution, tile, device, liif_dir=path_to_liif):
+    """
+    Return the flattened coordinate and cell tensors to query just one tile (see
+    `split_tiles`) of an `(h, w)` output, equal to the tile's slice of the full grid
+    from `make_query_grid` but without ever building the full grid.
+    """
+    import torch
+    _, utils = import_liif(liif_dir)
+    h, w = resolution
+    (y0, y1), (x0, x1) = tile
+    ys = utils.make_coord((h,))[y0:y1, 0]
+    xs = utils.make_coord((w,))[x0:x1, 0]
+    coord = torch.stack([
+        ys[:, None].expand(-1, len(xs)), xs[None, :].expand(len(ys), -1)
+    ], dim=-1).reshape(-1, 2).to(device)
+    cell = torch.ones_like(coord)
+    cell[:, 0] *= 2 / h
+    cell[:, 1] *= 2 / w
+    return coord, cell
+
+def load_input_tensor(png):
+    "Load a PNG as a normalised `(3, h, w)` tensor, as `demo.py` does via `ToTensor`"
+    import torch
+    img = np.asarray(Image.open(png).convert("RGB"))
+    img = torch.from_numpy(img.copy()).permute(2, 0, 1).float().div(255)
+    return (img - 0.5) / 0.5
+
+def pred_to_uint8(pred):
+    "Convert a `(..., 3)` prediction in [-1,1] to uint8, as `ToPILImage` does"
+    return (pred * 0.5 + 0.5).clamp(0, 1).mul(255).byte().cpu().numpy()
+
+def query_chunk_size(model, batch_size, in_shape, resolution, max_ram_mb):
+    """
+    Pick how many query coordinates to decode per pass so that decoding a batch of
+    `batch_size` glyphs of `in_shape` at `resolution` stays under `max_ram_mb`. The
+    fixed cost per glyph is its uint8 output plus the unfolded feature map (which
+    `query_rgb` rebuilds on every pass), the rest is shared out between queries.
+    """
+    encoder_dim = getattr(getattr(model, "encoder", None), "out_dim", 64)
+    feat_dim = encoder_dim * (9 if getattr(model, "feat_unfold", True) else 1)
+    h, w = resolution
+    fixed_bytes = batch_size * (feat_dim * in_shape[0] * in_shape[1] * 4 + h * w * 3)
+    # 4 local ensemble queries each holding the feature vector, relative coordinates
+    # and cell plus the decoder MLP activations, all in float32
+    bytes_per_query = 4 * (feat_dim + 4 + DECODER_HIDDEN_UNITS) * 4
+    free_bytes = max_ram_mb * 2**20 - fixed_bytes
+    chunk_size = free_bytes // (batch_size * bytes_per_query)
+    if chunk_size < MIN_QUERY_CHUNK:
+        raise ValueError(
+            f"{max_ram_mb=} is too small to decode a batch of {batch_size} glyphs "
+            f"at {resolution=} (needs at least {fixed_bytes / 2**20:.0f}MB + queries)"
+        )
+    return int(chunk_size)
+
+def enlarge_image_batch(model, pngs, resolution, bsize=None, max_ram_mb=None):
+    """
+    Superresolve the images at `pngs` (which must all be the same size) to
+    `resolution` (an `(h, w)` tuple) in a single encoder forward pass, then stream the
+    query grid through the implicit decoder in chunks of `bsize` coordinates (or of
+    as many as fit within `max_ram_mb`, if given). Returns a uint8 `(n, h, w, 3)` array.
+    """
+    import torch
+    device = next(model.parameters()).device
+    inp = torch.stack([load_input_tensor(png) for png in pngs]).to(device)
+    batch_size = inp.shape[0]
+    if max_ram_mb is not None:
+        bsize = query_chunk_size(model, batch_size, inp.shape[2:], resolution, max_ram_mb)
+    elif bsize is None:
+        bsize = QUERY_BATCH_SIZE
+    coord, cell = make_query_grid(resolution, device)
+    h, w = resolution
+    with torch.no_grad():
+        model.gen_feat(inp)
+        enlarged = decode_queries(model, coord, cell, batch_size, bsize)
+    return enlarged.reshape(batch_size, h, w, 3)
+
+def decode_queries(model, coord, cell, batch_size=1, bsize=QUERY_BATCH_SIZE):
+    """
+    Stream the query `coord` and `cell` tensors through the implicit decoder of a
+    `model` whose features have been generated (by `gen_feat`) for `batch_size`
+    images, in chunks of `bsize` coordinates. Returns a uint8 `(n, n_queries, 3)` array.
+    """
+    n_queries = coord.shape[0]
+    decoded = np.empty((batch_size, n_queries, 3), dtype=np.uint8)
+    for ql in range(0, n_queries, bsize):
+        qr = min(ql + bsize, n_queries)
+        coord_chunk = coord[None, ql:qr].expand(batch_size, -1, -1)
+        cell_chunk = cell[None, ql:qr].expand(batch_size, -1, -1)
+        decoded[:, ql:qr] = pred_to_uint8(model.query_rgb(coord_chunk, cell_chunk))
+    return decoded
+
+def decode_tile(model, resolution, tile, bsize=QUERY_BATCH_SIZE):
+    """
+    Decode one tile (see `split_tiles`) of the `resolution` output of the single image
+    whose features `model` has generated, returning a uint8 `(th, tw, 3)` array.
+    """
+    device = next(model.parameters()).device
+    (y0, y1), (x0, x1) = tile
+    coord, cell = make_tile_query_grid(resolution, tile, device)
+    return decode_queries(model, coord, cell, bsize=bsize)[0].reshape(y1 - y0, x1 - x0, 3)
+
+def encode_glyph(model, png):
+    "Generate the features of the image at `png` (for `decode_tile` to decode from)"
+    import torch
+    device = next(model.parameters()).device
+    with torch.no_grad():
+        model.gen_feat(load_input_tensor(png)[None].to(device))
+
+def enlarge_tile(
+        model, png, resolution, tile, bsize=QUERY_BATCH_SIZE, encode=True
+    ):
+    """
+    Superresolve just one tile (see `split_tiles`) of `png` enlarged to `resolution`,
+    running the encoder first unless `encode` is False (i.e. `model` already holds the
+    features of `png`, see `encode_glyph`)
+    """
+    import torch
+    if encode:
+        encode_glyph(model, png)
+    with torch.no_grad():
+        return decode_tile(model, resolution, tile, bsize)
+
+def enlarge_image_tiled(
+        model, png, resolution, tile_size=TILE_SIZE, bsize=QUERY_BATCH_SIZE
+    ):
+    """
+    Superresolve the image at `png` to `resolution` (an `(h, w)` tuple) one tile of at
+    most `tile_size` square at a time, so that the decoder's peak memory is bounded by
+    the tile size rather than the output size. As LIIF decodes each output pixel
+    independently from the shared feature map, the tiles need no overlap or blending:
+    the result is identical to `enlarge_image`.
+    """
+    import torch
+    device = next(model.parameters()).device
+    h, w = resolution
+    enlarged = np.empty((h, w, 3), dtype=np.uint8)
+    with torch.no_grad():
+        model.gen_feat(load_input_tensor(png)[None].to(device))
+        for tile in split_tiles(resolution, tile_size):
+            (y0, y1), (x0, x1) = tile
+            enlarged[y0:y1, x0:x1] = decode_tile(model, resolution, tile, bsize)
+    return enlarged
+
+def enlarge_image(model, png, resolution, bsize=QUERY_BATCH_SIZE):
+    """
+    Superresolve the image at `png` to `resolution` (an `(h, w)` tuple) with an already
+    loaded `model`, returning a uint8 RGB array. Equivalent to running `demo.py`.
+    """
+    return enlarge_image_batch(model, [png], resolution, bsize=bsize)[0]
+
+def enlarge_image_pyramid(model, png, resolutions, bsize=QUERY_BATCH_SIZE):
+    """
+    Superresolve the image at `png` to each of `resolutions` (`(h, w)` tuples),
+    running the encoder once and decoding every resolution's query grid from the same
+    feature map. Returns a list of uint8 RGB arrays, each identical to `enlarge_image`.
+    """
+    import torch
+    device = next(model.parameters()).device
+    enlarged = []
+    with torch.no_grad():
+        model.gen_feat(load_input_tensor(png)[None].to(device))
+        for h, w in resolutions:
+            coord, cell = make_query_grid((h, w), device)
+            decoded = decode_queries(model, coord, cell, bsize=bsize)
+            enlarged.append(decoded.reshape(h, w, 3))
+    return enlarged
+
+def submit_enlarged(
+        model, input_png, output_png, resolution, tile_size=None, writer=None
+    ):
+    """
+    Enlarge `input_png` to `resolution` (a `demo.py` style string), decoding it tile by
+    tile if a `tile_size` is given (see `enlarge_image_tiled`), and submit it to the
+    `ImageWriter` `writer` (default: a PNG as `demo.py` saves it), returning the write's
+    `Future`.
+    """
+    if tile_size is None:
+        enlarged = enlarge_image(model, input_png, parse_resolution(resolution))
+    else:
+        enlarged = enlarge_image_tiled(
+            model, input_png, parse_resolution(resolution), tile_size
+        )
+    return (writer or ImageWriter()).submit(enlarged, output_png)
+
+def enlarge_png(
+        model, input_png, output_png, resolution="2000,2000", tile_size=None, writer=None
+    ):
+    "Enlarge `input_png` and save it (see `submit_enlarged`), returning once it's written"
+    submit_enlarged(model, input_png, output_png, resolution, tile_size, writer).result()
+
+def enlarge_png_stream(
+        model, input_pngs, output_pngs, resolution="2000,2000", writer=None
+    ):
+    """
+    Enlarge several `input_pngs` one after another, saving each to the corresponding
+    path in `output_pngs`. With a background `writer`, each glyph is encoded while the
+    next is enlarged. Returns once all are written.
+    """
+    futures = [
+        submit_enlarged(model, input_png, output_png, resolution, writer=writer)
+        for input_png, output_png in zip(input_pngs, output_pngs)
+    ]
+    for future in futures:
+        future.result()
+
+def enlarge_png_pyramid(model, input_png, output_pngs, resolutions, writer=None):
+    """
+    Enlarge `input_png` to each of `resolutions` (`demo.py` style strings) from one
+    encoder pass, saving each to the corresponding path in `output_pngs` in order (so
+    when the last is in place, all are).
+    """
+    writer = writer or ImageWriter()
+    enlarged = enlarge_image_pyramid(model, input_png, map(parse_resolution, resolutions))
+    futures = [
+        writer.submit(img, output_png) for img, output_png in zip(enlarged, output_pngs)
+    ]
+    for future in futures:
+        future.result()
+
+def enlarge_png_subprocess(
+        input_png,
+        output_png,
+        resolution="2000,2000",
+        liif_script=path_to_liif / "demo.py",
+        model_path=path_to_model
+    ):
+    "Enlarge `input_png` by running the LIIF `demo.py` script, raising if it fails"
+    check_call([
+        "python", f"{liif_script}",
+        "--input", f"{input_png}",
+        "--model", f"{model_path}",
+        "--resolution", resolution,
+        "--output", f"{output_png}"
+    ])
+
+def enlarge_png_batch(
+        model,
+        input_pngs,
+        output_pngs,
+        resolution="2000,2000",
+        max_ram_mb=None,
+        writer=None
+    ):
+    """
+    Enlarge several `input_pngs` to `resolution` (a `demo.py` style string) together,
+    batched by input size, saving each to the corresponding path in `output_pngs`.
+    """
+    writer = writer or ImageWriter()
+    futures = []
+    by_size = {}
+    for input_png, output_png in zip(input_pngs, output_pngs):
+        by_size.setdefault(Image.open(input_png).size, []).append((input_png, output_png))
+    for pairs in by_size.values():
+        inputs, outputs = zip(*pairs)
+        enlarged = enlarge_image_batch(
+            model, inputs, parse_resolution(resolution), max_ram_mb=max_ram_mb
+        )
+        futures.extend(
+            writer.submit(img, output_png) for img, output_png in zip(enlarged, outputs)
+        )
+    for future in futures:
+        future.result()
+
+# Set by `init_worker` in each worker process of the pool, so that the model is
+# loaded (and the job manifest, if any, opened) once per worker rather than per glyph
+_worker_model = None
+_worker_manifest = None
+_worker_writer = None
+# The input whose features the worker's model holds (from its last tile job), so that
+# consecutive tiles of the same glyph don't re-run the encoder
+_worker_encoded_png = None
+
+def init_worker(
+        model_path, liif_dir, device, n_threads, manifest_path=None, writer_options=None
+    ):
+    global _worker_model, _worker_manifest, _worker_writer
+    import torch
+    torch.set_num_threads(n_threads) # Share the cores out rather than oversubscribe
+    _worker_model = load_model(model_path, liif_dir, device)
+    if manifest_path is not None:
+        _worker_manifest = JobManifest(manifest_path)
+    _worker_writer = ImageWriter(**(writer_options or {}))
+
+def run_tracked_jobs(input_pngs, output_pngs, enlarge):
+    """
+    Call `enlarge()` to write `output_pngs`, recording the jobs' progress in the
+    worker's manifest (if any). A failure is recorded and reported rather than raised,
+    so that one bad glyph doesn't bring down the pool. Returns whether it succeeded.
+    """
+    if _worker_manifest is None:
+        enlarge()
+        return True
+    names = [input_png.name for input_png in input_pngs]
+    _worker_manifest.mark_running(names)
+    try:
+        enlarge()
+    except Exception as e:
+        for name in names:
+            _worker_manifest.mark_failed(name, e)
+        print(f"Failed to enlarge {names}: {e!r}", file=stderr)
+        return False
+    for name, output_png in zip(names, output_pngs):
+        _worker_manifest.mark_done(name, output_png)
+    return True
+
+def enlarge_job(job):
+    "Enlarge one `(input_png, output_png, resolution)` job, returning its latency"
+    input_png, output_png, resolution = job
+    t0 = perf_counter()
+    enlarge = partial(
+        enlarge_png, _worker_model, input_png, output_png, resolution,
+        writer=_worker_writer
+    )
+    if not run_tracked_jobs([input_png], [output_png], enlarge):
+        return []
+    return [(input_png.name, perf_counter() - t0)]
+
+def enlarge_stream_job(job):
+    """
+    Enlarge one `(input_pngs, output_pngs, resolution)` stream job (see
+    `enlarge_png_stream`), returning the latency of each glyph (its share of the job's
+    wall-clock time)
+    """
+    input_pngs, output_pngs, resolution = job
+    t0 = perf_counter()
+    enlarge = partial(
+        enlarge_png_stream, _worker_model, input_pngs, output_pngs, resolution,
+        writer=_worker_writer
+    )
+    if not run_tracked_jobs(input_pngs, output_pngs, enlarge):
+        return []
+    seconds = (perf_counter() - t0) / len(input_pngs)
+    return [(input_png.name, seconds) for input_png in input_pngs]
+
+def enlarge_pyramid_job(job):
+    """
+    Enlarge one `(input_png, output_pngs, resolutions)` pyramid job, returning its
+    latency (the manifest records it by its last output, which is written last)
+    """
+    input_png, output_pngs, resolutions = job
+    t0 = perf_counter()
+    enlarge = partial(
+        enlarge_png_pyramid, _worker_model, input_png, output_pngs, resolutions,
+        writer=_worker_writer
+    )
+    if not run_tracked_jobs([input_png], output_pngs[-1:], enlarge):
+        return []
+    return [(input_png.name, perf_counter() - t0)]
+
+def enlarge_batch_job(job):
+    """
+    Enlarge one `(input_pngs, output_pngs, resolution, max_ram_mb)` batch job,
+    returning the latency of each glyph (its share of the batch's wall-clock time)
+    """
+    input_pngs, output_pngs, resolution, max_ram_mb = job
+    t0 = perf_counter()
+    enlarge = partial(
+        enlarge_png_batch, _worker_model, input_pngs, output_pngs, resolution,
+        max_ram_mb, writer=_worker_writer
+    )
+    if not run_tracked_jobs(input_pngs, output_pngs, enlarge):
+        return []
+    seconds = (perf_counter() - t0) / len(input_pngs)
+    return [(input_png.name, seconds) for input_png in input_pngs]
+
+def enlarge_tile_job(job):
+    """
+    Decode one `(input_png, resolution, tile)` tile job, returning the input, the tile,
+    its pixels (or the exception raised) and its latency. The glyph is only encoded if
+    it differs from the one this worker last encoded.
+    """
+    global _worker_encoded_png
+    input_png, resolution, tile = job
+    t0 = perf_counter()
+    try:
+        if input_png != _worker_encoded_png:
+            _worker_encoded_png = None # Until the new features are complete
+            encode_glyph(_worker_model, input_png)
+            _worker_encoded_png = input_png
+        pixels = enlarge_tile(
+            _worker_model, input_png, parse_resolution(resolution), tile, encode=False
+        )
+    except Exception as e:
+        pixels = e
+    return input_png, tile, pixels, perf_counter() - t0
+
+def record_writes(writes, manifest, wait=False):
+    """
+    Mark each glyph in `writes` (a list of `(input_name, output_png, future)`) whose
+    write has finished (or all of them, waiting if `wait` is True) as done or failed in
+    the `manifest` (if any), returning those still being written
+    """
+    unfinished = []
+    for name, output_png, future in writes:
+        if not (wait or future.done()):
+            unfinished.append((name, output_png, future))
+            continue
+        try:
+            future.result()
+        except Exception as e:
+            if manifest is not None:
+                manifest.mark_failed(name, e)
+            print(f"Failed to write {output_png}: {e!r}", file=stderr)
+            continue
+        if manifest is not None:
+            manifest.mark_done(name, output_png)
+    return unfinished
+
+def enlarge_pngs_tiled(
+        jobs, tile_size, n_cores, initargs, manifest_path, show_progress, writer
+    ):
+    """
+    Split each `(input_png, output_png, resolution)` job into tiles of at most
+    `tile_size` square (see `split_tiles`), decode the tiles across the worker pool and
+    assemble each glyph's tiles as they arrive, saving it with the `ImageWriter`
+    `writer` once all are in. A glyph's latency is the sum of its tiles' latencies.
+
+    Each worker keeps the features of the glyph it last encoded, and is handed runs of
+    consecutive tiles of one glyph: a whole glyph's tiles when there are at least as
+    many glyphs as workers, otherwise an equal share of them for each worker. So each
+    glyph is encoded once, or at most once per worker, rather than once per tile.
+    """
+    tile_jobs = []
+    output_of = {}
+    n_tiles = {}
+    for input_png, output_png, resolution in jobs:
+        tiles = split_tiles(parse_resolution(resolution), tile_size)
+        tile_jobs.extend((input_png, resolution, tile) for tile in tiles)
+        output_of[input_png.name] = (output_png, parse_resolution(resolution))
+        n_tiles[input_png.name] = len(tiles)
+    # The workers only decode tiles: the assembled glyphs are tracked from here
+    manifest = None if manifest_path is None else JobManifest(manifest_path)
+    if manifest is not None:
+        manifest.mark_running([*output_of])
+    in_progress = {} # input filename to its (partly) assembled output array
+    writes = [] # glyphs being written (see `record_writes`)
+    latencies = {}
+    workers_per_glyph = max(1, n_cores // max(1, len(n_tiles)))
+    chunksize = -(-max(n_tiles.values(), default=1) // workers_per_glyph)
+    for input_png, tile, pixels, seconds in pool_multiprocess(
+        enlarge_tile_job, tile_jobs, n_cores, init_worker, initargs, show_progress,
+        chunksize
+    ):
+        name = input_png.name
+        if name not in n_tiles:
+            continue # Already failed on another tile
+        output_png, (h, w) = output_of[name]
+        if isinstance(pixels, Exception):
+            del n_tiles[name]
+            in_progress.pop(name, None)
+            latencies.pop(name, None)
+            if manifest is not None:
+                manifest.mark_failed(name, pixels)
+            print(f"Failed to enlarge {[name]}: {pixels!r}", file=stderr)
+            continue
+        if name not in in_progress:
+            in_progress[name] = np.empty((h, w, 3), dtype=np.uint8)
+        (y0, y1), (x0, x1) = tile
+        in_progress[name][y0:y1, x0:x1] = pixels
+        latencies[name] = latencies.get(name, 0) + seconds
+        n_tiles[name] -= 1
+        if n_tiles[name] == 0:
+            future = writer.submit(in_progress.pop(name), output_png)
+            writes.append((name, output_png, future))
+        writes = record_writes(writes, manifest)
+    record_writes(writes, manifest, wait=True)
+    if manifest is not None:
+        manifest.close()
+    return latencies
+
+def enlarge_pngs(
+        jobs,
+        n_cores=1,
+        model_path=path_to_model,
+        liif_dir=path_to_liif,
+        device=None,
+        batch_size=1,
+        max_ram_mb=None,
+        manifest_path=None,
+        show_progress=True,
+        tile_size=None,
+        pyramid=None,
+        writer_options=None
+    ):
+    """
+    Run a list of `(input_png, output_png, resolution)` enlargement jobs on `n_cores`
+    persistent worker processes, each of which loads the model once then pulls glyphs
+    from the shared queue. Returns a dict of per-glyph latencies in seconds (which
+    exclude the one-off model loading).
+
+    If `batch_size` is more than 1, each worker enlarges that many glyphs (of the same
+    resolution) per encoder forward pass, decoding queries in chunks sized to keep
+    each worker's peak RAM under `max_ram_mb` (if given).
+
+    If a `manifest_path` is given, each job's progress is recorded in that
+    `JobManifest` and failed jobs are marked as such rather than raised.
+
+    If a `tile_size` is given, each output is instead split into tiles of at most that
+    size square which are spread across the workers, bounding each worker's peak RAM by
+    the tile size rather than the output resolution (see `enlarge_image_tiled`).
+
+    If a `pyramid` dict of further resolutions to output directories is given, each
+    glyph is encoded once and also decoded at each of those resolutions (see
+    `enlarge_image_pyramid`), saved under the same filename in that resolution's
+    directory. The job's own output is written last, so once it is done all are.
+
+    The outputs are written by an `ImageWriter` made with the `writer_options` (if
+    given) in each worker, e.g. a faster PNG compression level or another format for
+    intermediate artefacts (see `image_writer.py`). If it writes in the background,
+    glyphs are handed out `STREAM_CHUNK_SIZE` at a time so that each one's encoding
+    overlaps the next one's inference.
+    """
+    from multiprocessing import cpu_count
+    n_threads = max(1, cpu_count() // n_cores)
+    writer_options = writer_options or {}
+    initargs = (model_path, liif_dir, device, n_threads, manifest_path, writer_options)
+    if pyramid and (tile_size is not None or batch_size > 1):
+        raise ValueError("Pyramid mode enlarges one whole glyph per encoder pass")
+    if tile_size is not None:
+        worker_initargs = (model_path, liif_dir, device, n_threads)
+        writer = ImageWriter(**writer_options)
+        try:
+            return enlarge_pngs_tiled(
+                jobs, tile_size, n_cores, worker_initargs, manifest_path, show_progress,
+                writer
+            )
+        finally:
+            writer.close()
+    if batch_size > 1:
+        by_resolution = {}
+        for input_png, output_png, resolution in jobs:
+            by_resolution.setdefault(resolution, []).append((input_png, output_png))
+        job_func = enlarge_batch_job
+        jobs = [
+            (*zip(*batch), resolution, max_ram_mb)
+            for resolution, pairs in by_resolution.items()
+            for batch in chunked(pairs, batch_size)
+        ]
+    elif pyramid:
+        for out_dir in pyramid.values():
+            Path(out_dir).mkdir(parents=True, exist_ok=True)
+        job_func = enlarge_pyramid_job
+        jobs = [
+            (
+                input_png,
+                [Path(out_dir) / output_png.name for out_dir in pyramid.values()]
+                + [output_png],
+                [*pyramid, resolution]
+            )
+            for input_png, output_png, resolution in jobs
+        ]
+    elif writer_options.get("background"):
+        by_resolution = {}
+        for input_png, output_png, resolution in jobs:
+            by_resolution.setdefault(resolution, []).append((input_png, output_png))
+        job_func = enlarge_stream_job
+        jobs = [
+            (*zip(*chunk), resolution)
+            for resolution, pairs in by_resolution.items()
+            for chunk in chunked(pairs, STREAM_CHUNK_SIZE)
+        ]
+    else:
+        job_func = enlarge_job
+    latencies = {}
+    for job_latencies in pool_multiprocess(
+        job_func, jobs, n_cores, init_worker, initargs, show_progress
+    ):
+        latencies.update(job_latencies)
+    return latencies
+
+def report_latencies(latencies, file=stderr):
+    "Print a summary of per-glyph latencies (in seconds) for comparison between runs"
+    if not latencies:
+        return
+    times = np.array([*latencies.values()])
+    print(
+        f"Enlarged {times.size} PNGs: {times.mean():.2f}s mean, "
+        f"{np.median(times):.2f}s median, {times.max():.2f}s max per glyph "
+        f"({times.sum():.1f}s total)",
+        file=file
+    )
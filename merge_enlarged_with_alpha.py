@@ -1,9 +1,9 @@
 from pathlib import Path
-import sqlite3
-import pandas as pd
 from tqdm import tqdm
 from sys import stderr
-from imageio import imread, imwrite
+from array_store import load_image
+from shade_lookup import get_shade
+from image_writer import FINAL, INTERMEDIATE, write_image
 import numpy as np
 from skimage import transform as tf
 from matplotlib import pyplot as plt
@@ -15,30 +15,31 @@ osx_dir = Path("osx/catalina/").absolute()
 png_dir = Path("enlarged/").absolute()
 alpha_dir = Path("enlarged_alpha/").absolute()
 out_dir = Path("transparent/").absolute()
-pngs = [p for p in alpha_dir.iterdir() if p.suffix == ".png"]
+# The format each directory was written in: the `WRITER_OPTIONS` of
+# `enlarge_osx_glyphs.py` and `enlarge_osx_alpha_masks.py` (or ".png" via `demo.py`)
+enlarged_suffix = f".{INTERMEDIATE['fmt']}"
+alpha_suffix = f".{INTERMEDIATE['fmt']}"
+# Memory-mapped arrays of the enlarged glyphs and masks (see `array_store.py`) if their
+# scripts stored them, e.g. `Path("enlarged_npy").absolute()`, or None to decode them
+enlarged_array_dir = None
+alpha_array_dir = None
+pngs = [p for p in alpha_dir.iterdir() if p.suffix == alpha_suffix]
 osx_bw_db = osx_dir / "emoji_bw_calc.db"
 NO_OVERWRITE = True
 shuffle(pngs)
 
-def get_emoji_bw_bg(glyph):
-    with sqlite3.connect(osx_bw_db) as conn:
-        query_sql = "SELECT * FROM images WHERE filename == (?)"
-        query_df = pd.read_sql(query_sql, con=conn, params=[glyph])
-        shade = query_df.loc[:, "furthest_shade"].values
-    return shade
-
 try:
     for png in tqdm(pngs):
-        enlarged_png = png_dir / png.name
-        output_png = out_dir / png.name
+        enlarged_png = png_dir / f"{png.stem}{enlarged_suffix}"
+        output_png = out_dir / f"{png.stem}.png" # A final deliverable
         if output_png.exists() and NO_OVERWRITE:
             continue
         elif not enlarged_png.exists():
             raise NameError(f"Expected '{enlarged_png}' corresponding to input '{png.name}'")
-        alpha = imread(png)[:,:,0] # Keep R, discard identical G and B channels
-        img = imread(enlarged_png)
+        alpha = load_image(png, alpha_array_dir)[:,:,0] # Keep R, drop identical G, B
+        img = load_image(enlarged_png, enlarged_array_dir)
         decomposited = np.insert(img, 3, alpha, axis=2)
-        bg_shade = get_emoji_bw_bg(png.name)
+        bg_shade = get_shade(f"{png.stem}.png", osx_bw_db)
         alpha_mask = (alpha > 0) & (alpha < 255) # Between transparent and opaque
         # Calculate the recolouring (R′,G′,B′) based on opacity A and the bg_shade S
         # In the range [0,1] a pixel (R,G,B,A) composited onto (S,S,S) becomes:
@@ -65,7 +66,7 @@ try:
             fig.tight_layout()
             fig.show()
         else:
-            imwrite(output_png, output_img)
+            write_image(output_img, output_png, **FINAL)
         break
 except KeyboardInterrupt:
     print(f"Aborted while processing {png.name}")
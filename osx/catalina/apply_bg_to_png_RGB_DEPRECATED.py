@@ -1,17 +1,39 @@
 import sqlite3
+import sys
 import pandas as pd
+from multiprocessing import Pool, cpu_count
+from pathlib import Path
 from subprocess import call
 from tqdm import tqdm
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[2])) # repo root
+from compositing import flatten_png
+
+# Flatten in-process with NumPy (the pixels are identical to ImageMagick's, see
+# `check_bg_parity.py`) rather than spawning `convert` once per glyph
+USE_IMAGEMAGICK = False
+N_CORES = cpu_count()
+
 db_filename = "emoji_rgb_calc.db"
 with sqlite3.connect(db_filename) as conn:
     bg_sql = "SELECT * FROM images WHERE filename != 'glyph-hiddenglyph.png'"
     bg_df = pd.read_sql(bg_sql, con=conn)
 
-for row_idx, row in tqdm(bg_df.iterrows(), total=bg_df.shape[0]):
-    ejp_filename, r, g, b = row.loc[["filename", *"RGB"]]
-    call([
-        "convert", f"png/{ejp_filename}",
-        "-background", f"rgb({r},{g},{b})",
-        "-flatten", f"bg/{ejp_filename}"
-    ])
+def flatten_job(job):
+    ejp_filename, bg_rgb = job
+    flatten_png(f"png/{ejp_filename}", f"bg/{ejp_filename}", bg_rgb)
+
+if __name__ == "__main__":
+    jobs = [*zip(bg_df.filename, zip(bg_df.R, bg_df.G, bg_df.B))]
+    if USE_IMAGEMAGICK:
+        for ejp_filename, (r, g, b) in tqdm(jobs):
+            call([
+                "convert", f"png/{ejp_filename}",
+                "-background", f"rgb({r},{g},{b})",
+                "-flatten", f"bg/{ejp_filename}"
+            ])
+    else:
+        with Pool(N_CORES) as pool:
+            flattened = pool.imap_unordered(flatten_job, jobs, chunksize=32)
+            for _ in tqdm(flattened, total=len(jobs)):
+                pass
@@ -0,0 +1,153 @@
+import numpy as np
+from enum import IntEnum
+from PIL import Image
+
+__all__ = [
+    "ShadeEnum", "read_rgba", "semi_visible_colours", "grey_distances",
+    "estimate_bg_rows", "shade_rows", "cartesian_product", "colour_cloud_distances",
+    "estimate_rgb_bg_row"
+]
+
+class ShadeEnum(IntEnum):
+    B  = 0
+    D1 = 32
+    D2 = 64
+    D3 = 96
+    G  = 128
+    L1 = 160
+    L2 = 192
+    L3 = 233 # 233 replacing 224 specifically for u1F3BC
+    W  = 255
+
+SHADES = np.array([*ShadeEnum._value2member_map_], dtype=np.int64)
+
+def read_rgba(png):
+    """
+    Decode a glyph PNG as an RGBA array. Some glyphs (e.g. u1F3BC) are stored as
+    grayscale with alpha, which must be expanded rather than read as 2 channels.
+    """
+    with Image.open(png) as img:
+        return np.asarray(img.convert("RGBA"))
+
+def semi_visible_colours(img):
+    """
+    Return the visible RGBA pixels of `img` and the unique RGB colours of its
+    semi-transparent pixels (the latter with each channel sorted independently,
+    as the shade statistics have always been computed on).
+    """
+    if img.ndim != 3 or img.shape[-1] != 4:
+        raise ValueError(f"Expected an RGBA image array, got shape {img.shape}")
+    all_vis_rgba = img.reshape(-1, 4)[img.reshape(-1,4)[:,3] > 0]
+    all_semi_vis_rgba = all_vis_rgba[all_vis_rgba[:,3] < 255]
+    all_semi_vis_rgb = np.unique(np.sort(all_semi_vis_rgba[:,:3], axis=0), axis=0)
+    return all_vis_rgba, all_semi_vis_rgb
+
+def grey_distances(rgb, shades=SHADES):
+    """
+    Return the `(n_shades, n_colours)` Euclidean distances from each grey `(s, s, s)`
+    to each of the `(n_colours, 3)` colours `rgb` (laid out shade by colour so that
+    each shade's distances are contiguous when averaged).
+    """
+    diffs = rgb[None, :, :].astype(np.int64) - shades[:, None, None]
+    return np.sqrt((diffs ** 2).sum(axis=-1).astype(np.float64))
+
+def furthest_shade(all_mean_distances, median_tone):
+    "Pick the shade furthest on average, breaking ties by the glyph's median tone"
+    shade_idx = [
+        i for (i,d) in enumerate(all_mean_distances) if d == max(all_mean_distances)
+    ]
+    if len(shade_idx) > 1:
+        # Only expected to happen when B and W are equidistant
+        far_shades = SHADES[shade_idx]
+        return int(far_shades[np.abs(far_shades - median_tone).argsort()][-1])
+    return int(SHADES[shade_idx[0]])
+
+def estimate_bg_rows(pngs):
+    """
+    Compute the `images` table row (filename, the 9 `has_` flags, the 9 `dist_` mean
+    distances, median tone and furthest shade) for each of a batch of glyph PNGs.
+    """
+    return shade_rows([png.name for png in pngs], [read_rgba(png) for png in pngs])
+
+def shade_rows(filenames, imgs):
+    """
+    Compute the `images` table rows (see `estimate_bg_rows`) for a batch of decoded
+    glyph image arrays `imgs` named `filenames`. The distances of all the glyphs'
+    colours to all the shades are computed in one go.
+    """
+    colour_sets = [semi_visible_colours(img) for img in imgs]
+    all_semi_vis_rgb = np.concatenate([rgb for _, rgb in colour_sets])
+    distances = grey_distances(all_semi_vis_rgb)
+    is_shade = np.all(all_semi_vis_rgb[None, :, :] == SHADES[:, None, None], axis=2)
+    bounds = np.cumsum([0, *(len(rgb) for _, rgb in colour_sets)])
+    rows = []
+    for filename, (all_vis_rgba, _), start, stop in zip(
+        filenames, colour_sets, bounds[:-1], bounds[1:]
+    ):
+        # Take the median of the distribution of mean RGB per visible pixel
+        # to use when deciding between B and W when equidistant
+        median_tone = int(np.median(all_vis_rgba[:,:3].mean(axis=1)))
+        # has_B, has_D1, has_D2, has_D3, has_G, has_L1, has_L2, has_L3, has_W
+        has_shade_flags = [*map(int, is_shade[:, start:stop].any(axis=1))]
+        # B_dbar, D1_dbar, ..., W_dbar (-1 for shades the glyph already contains)
+        mean_distances = distances[:, start:stop].mean(axis=1).astype(int)
+        all_mean_distances = [
+            -1 if has_shade else int(d)
+            for has_shade, d in zip(has_shade_flags, mean_distances)
+        ]
+        rows.append((
+            filename, *has_shade_flags, *all_mean_distances,
+            median_tone, furthest_shade(all_mean_distances, median_tone)
+        ))
+    return rows
+
+def cartesian_product(arrays):
+    "Courtesy of https://stackoverflow.com/a/11146645/2668831"
+    la = len(arrays)
+    dtype = np.result_type(*arrays)
+    arr = np.empty([la] + [len(a) for a in arrays], dtype=dtype)
+    for i, a in enumerate(np.ix_(*arrays)):
+        arr[i, ...] = a
+    return arr.reshape(la, -1).T
+
+RGB_SHADES = np.linspace(0, 255, 5, dtype=np.uint8)
+COLOUR_CLOUD = cartesian_product([RGB_SHADES] * 3) # 125 values to choose from
+# Limit on the number of (cloud colour, glyph colour, channel) differences held at once
+MAX_CLOUD_DIFFS = 2**24
+
+def colour_cloud_distances(rgb, cloud=COLOUR_CLOUD):
+    """
+    Return the `(n_cloud, n_colours)` distances from each of the `cloud` colours to
+    each of the `(n_colours, 3)` colours `rgb`, computed in chunks of cloud colours
+    to bound the memory used for glyphs with many semi-transparent colours.
+
+    Note that these are the distances the RGB background search has always used, in
+    which the `uint8` channel differences wrap around (so this is not a metric which
+    a KD-tree could search).
+    """
+    distances = np.empty((len(cloud), len(rgb)))
+    chunk_size = max(1, MAX_CLOUD_DIFFS // max(1, 3 * len(rgb)))
+    for start in range(0, len(cloud), chunk_size):
+        chunk = slice(start, start + chunk_size)
+        diffs = (cloud[chunk, None, :] - rgb[None, :, :]).astype(np.float64)
+        distances[chunk] = np.sqrt((diffs ** 2).sum(axis=-1))
+    return distances
+
+def estimate_rgb_bg_row(png):
+    """
+    Compute the `images` table row (filename, R, G, B, min_d) of the RGB background
+    estimate for a glyph PNG: the colour cloud colour matching none of the glyph's
+    semi-transparent colours which is furthest from them by (min, max, mean) distance
+    (the last in the cloud's order if tied).
+    """
+    _, all_semi_vis_rgb = semi_visible_colours(read_rgba(png))
+    distances = colour_cloud_distances(all_semi_vis_rgb)
+    # Don't use a background colour that will erase or blend with any semi-visible
+    # pixel's colour: we want one as distant as possible from these
+    candidates = np.flatnonzero(~np.any(distances == 0, axis=1))
+    min_d = distances.min(axis=1).astype(int)
+    max_d = distances.max(axis=1).astype(int)
+    mean_d = distances.mean(axis=1).astype(int)
+    best = max(candidates, key=lambda i: (min_d[i], max_d[i], mean_d[i], i))
+    r, g, b = [int(v) for v in COLOUR_CLOUD[best]]
+    return (png.name, r, g, b, int(min_d[best]))
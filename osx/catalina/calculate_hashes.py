@@ -1,9 +1,22 @@
 from tqdm import tqdm
 from pathlib import Path
 import sqlite3
+import sys
+from multiprocessing import Pool, cpu_count
+from more_itertools import chunked
 from PIL import Image
 from imagehash import average_hash, colorhash, dhash
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[2])) # repo root
+from image_hashing import hash_pngs
+
+# PNGs hashed and rows written per transaction, and worker processes hashing them
+BATCH_SIZE = 256
+N_CORES = cpu_count()
+# Hash each batch of PNGs with array operations rather than one `imagehash` call at a
+# time (the hashes are identical, see `benchmark_image_hashing.py`)
+USE_BATCH_HASHING = True
+
 def hash_emoji(img_fname):
     "Return average/color/diff hashes (lengths 64, 49, 64 respectively)"
     img = Image.open(img_fname)
@@ -13,23 +26,39 @@ def hash_emoji(img_fname):
     d = dhash(mini_img, hash_size=16)
     return str(a), str(c), str(d)
 
+def hash_rows(png_batch):
+    "Return the `osx_hashes` table rows for a batch of PNGs"
+    if USE_BATCH_HASHING:
+        hashes = hash_pngs(png_batch)
+    else:
+        hashes = map(hash_emoji, png_batch)
+    return [
+        (png.name, png.stem[6:], a_hash, c_hash, d_hash) # remove "glyph-" prefix
+        for png, (a_hash, c_hash, d_hash) in zip(png_batch, hashes)
+    ]
+
 db_filename = "osx_emoji_hashes.db"
 png_dir = Path("png")
 pngs = [p for p in png_dir.iterdir() if p.is_file() and p.suffix == ".png"]
 
-with sqlite3.connect(db_filename) as conn:
-    c = conn.cursor()
-    c.execute("""
-    CREATE TABLE IF NOT EXISTS osx_hashes
-    (filename tinytext, codepoint_part varchar(32), a_hash varchar(64),
-    c_hash varchar(49), d_hash varchar(64), Constraint pk_fn Primary key(filename))
-    """)
-
-for png in tqdm(pngs):
-    codepoint_part = png.stem[6:] # remove "glyph-" prefix and ".png" suffix
-    a_hash, c_hash, d_hash = hash_emoji(png)
+if __name__ == "__main__":
     with sqlite3.connect(db_filename) as conn:
+        conn.execute("PRAGMA journal_mode=WAL")
         c = conn.cursor()
-        values = (png.name, codepoint_part, a_hash, c_hash, d_hash)
-        c.execute("INSERT INTO osx_hashes VALUES (?,?,?,?,?)", values)
-        conn.commit()
+        c.execute("""
+        CREATE TABLE IF NOT EXISTS osx_hashes
+        (filename tinytext, codepoint_part varchar(32), a_hash varchar(64),
+        c_hash varchar(49), d_hash varchar(64), Constraint pk_fn Primary key(filename))
+        """)
+        with Pool(N_CORES) as pool:
+            png_batches = [*chunked(pngs, BATCH_SIZE)]
+            row_batches = pool.imap(hash_rows, png_batches)
+            for batch in tqdm(row_batches, total=len(png_batches)):
+                # Upsert so that a rerun overwrites rather than violating `pk_fn`
+                c.executemany("""
+                INSERT INTO osx_hashes VALUES (?,?,?,?,?)
+                ON CONFLICT(filename) DO UPDATE SET
+                codepoint_part = excluded.codepoint_part, a_hash = excluded.a_hash,
+                c_hash = excluded.c_hash, d_hash = excluded.d_hash
+                """, batch)
+                conn.commit()
@@ -0,0 +1,41 @@
+"""
+Check that `bg_estimation.py` reproduces the committed background estimates for every
+glyph in `png/`: the shade statistics of `emoji_bw_calc.tsv` and the RGB backgrounds of
+`emoji_rgb_calc.tsv`. Exits non-zero if any row differs or is missing.
+
+Usage: python check_bg_estimation.py
+"""
+import csv
+import sys
+from pathlib import Path
+from more_itertools import chunked
+from tqdm import tqdm
+from bg_estimation import estimate_bg_rows, estimate_rgb_bg_row
+
+BATCH_SIZE = 64
+
+png_dir = Path("png")
+pngs = sorted(p for p in png_dir.iterdir() if p.is_file() and p.suffix == ".png")
+
+def read_tsv(tsv_filename):
+    with open(tsv_filename) as tsvfile:
+        return {row[0]: row for row in csv.reader(tsvfile, delimiter="\t")}
+
+def compare_rows(rows, tsv_filename):
+    "Return the filenames whose computed row differs from (or is missing in) the TSV"
+    expected = read_tsv(tsv_filename)
+    mismatches = [row[0] for row in rows if [*map(str, row)] != expected.get(row[0])]
+    print(f"{len(mismatches)} of {len(rows)} differ from {tsv_filename}: {mismatches}",
+          file=sys.stderr)
+    return mismatches
+
+bw_rows = [
+    row for png_batch in tqdm([*chunked(pngs, BATCH_SIZE)])
+    for row in estimate_bg_rows(png_batch)
+]
+rgb_rows = [estimate_rgb_bg_row(png) for png in tqdm(pngs)]
+mismatches = [
+    *compare_rows(bw_rows, "emoji_bw_calc.tsv"),
+    *compare_rows(rgb_rows, "emoji_rgb_calc.tsv"),
+]
+sys.exit(1 if mismatches else 0)
@@ -0,0 +1,67 @@
+"""
+Check that `compositing.flatten_rgba` gives the same pixels as ImageMagick's flatten,
+by comparing it against the `bg/` PNGs previously written by `convert` (and against
+fresh `convert` outputs for a sample of glyphs if ImageMagick is installed). Exits
+non-zero if any glyph differs or has no `bg/` PNG.
+
+Usage: python check_bg_parity.py [db_filename] [n_sample]
+"""
+import shutil
+import sqlite3
+import sys
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from PIL import Image
+from subprocess import check_call
+from tempfile import TemporaryDirectory
+from tqdm import tqdm
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2])) # repo root
+from compositing import flatten_rgba
+
+db_filename = sys.argv[1] if len(sys.argv) > 1 else "emoji_bw_calc.db"
+n_sample = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+def read_rgba(png):
+    with Image.open(png) as img:
+        return np.asarray(img.convert("RGBA"))
+
+with sqlite3.connect(db_filename) as conn:
+    bg_sql = "SELECT * FROM images WHERE filename != 'glyph-hiddenglyph.png'"
+    bg_df = pd.read_sql(bg_sql, con=conn)
+
+if "furthest_shade" in bg_df:
+    bg_colours = [*zip(*[bg_df.furthest_shade] * 3)]
+else:
+    bg_colours = [*zip(bg_df.R, bg_df.G, bg_df.B)]
+jobs = [*zip(bg_df.filename, bg_colours)]
+
+mismatches = []
+for filename, bg_rgb in tqdm(jobs):
+    if not (Path("bg") / filename).exists():
+        mismatches.append(filename)
+        continue
+    flat = flatten_rgba(read_rgba(Path("png") / filename), bg_rgb)
+    if not np.array_equal(flat, read_rgba(Path("bg") / filename)):
+        mismatches.append(filename)
+print(f"{len(mismatches)} of {len(jobs)} don't match bg/: {mismatches}",
+      file=sys.stderr)
+
+if shutil.which("convert"):
+    with TemporaryDirectory() as tmp_dir:
+        for filename, (r, g, b) in tqdm(jobs[:n_sample]):
+            out_png = Path(tmp_dir) / filename
+            check_call([
+                "convert", f"png/{filename}",
+                "-background", f"rgb({r},{g},{b})",
+                "-flatten", str(out_png)
+            ])
+            flat = flatten_rgba(read_rgba(Path("png") / filename), (r, g, b))
+            if not np.array_equal(flat, read_rgba(out_png)):
+                mismatches.append(filename)
+    print(f"Compared {n_sample} against fresh `convert` outputs", file=sys.stderr)
+else:
+    print("ImageMagick `convert` not found, skipped fresh comparison", file=sys.stderr)
+
+sys.exit(1 if mismatches else 0)
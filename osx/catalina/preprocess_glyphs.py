@@ -0,0 +1,92 @@
+from tqdm import tqdm
+from pathlib import Path
+import sqlite3
+import sys
+import numpy as np
+from multiprocessing import Pool, cpu_count
+from more_itertools import chunked
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2])) # repo root
+from compositing import flatten_rgba
+from image_hashing import hash_thumbnails
+from bg_estimation import shade_rows
+
+# Decode each glyph PNG once and from it write its alpha mask PNG, shade statistics row,
+# background flattened PNG and hashes: the same outputs as `extract_alpha.py`,
+# `calculate_bg.py`, `apply_bg_to_png.py` and `calculate_hashes.py` run in turn
+
+# PNGs processed per pool task and rows written per transaction, and worker processes
+BATCH_SIZE = 64
+N_CORES = cpu_count()
+
+bw_db_filename = "emoji_bw_calc.db"
+hash_db_filename = "osx_emoji_hashes.db"
+png_dir = Path("png")
+alpha_dir = Path("alpha")
+bg_dir = Path("bg")
+pngs = [p for p in png_dir.iterdir() if p.is_file() and p.suffix == ".png"]
+
+def preprocess_batch(png_batch):
+    """
+    Decode each of a batch of glyph PNGs once, writing its alpha mask PNG and its
+    background flattened PNG, and return the batch's `images` table rows (for the
+    background shade) and `osx_hashes` table rows.
+    """
+    rgbas = []
+    thumbs = np.empty((len(png_batch), 32, 32, 3), dtype=np.uint8)
+    for i, png in enumerate(png_batch):
+        with Image.open(png) as img:
+            img.load()
+            rgbas.append(np.asarray(img.convert("RGBA")))
+            thumbs[i] = np.asarray(img.resize((32,32)).convert("RGB"))
+    bw_rows = shade_rows([png.name for png in png_batch], rgbas)
+    for png, rgba, bw_row in zip(png_batch, rgbas, bw_rows):
+        # Write each PNG's alpha mask as grayscale RGB PNG
+        alpha = rgba[:, :, 3:].repeat(3, axis=2)
+        Image.fromarray(alpha).save(alpha_dir / png.name)
+        if png.name != "glyph-hiddenglyph.png":
+            shade = bw_row[-1] # furthest_shade
+            Image.fromarray(flatten_rgba(rgba, (shade,) * 3)).save(bg_dir / png.name)
+    hash_rows = [
+        (png.name, png.stem[6:], a_hash, c_hash, d_hash) # remove "glyph-" prefix
+        for png, (a_hash, c_hash, d_hash) in zip(png_batch, hash_thumbnails(thumbs))
+    ]
+    return bw_rows, hash_rows
+
+if __name__ == "__main__":
+    alpha_dir.mkdir(exist_ok=True)
+    bg_dir.mkdir(exist_ok=True)
+    with sqlite3.connect(bw_db_filename) as bw_conn, \
+            sqlite3.connect(hash_db_filename) as hash_conn:
+        for conn in (bw_conn, hash_conn):
+            conn.execute("PRAGMA journal_mode=WAL")
+        bw_conn.execute("""
+        CREATE TABLE IF NOT EXISTS images
+        (filename tinytext,
+        has_B tinyint, has_D1 tinyint, has_D2 tinyint, has_D3 tinyint, has_G tinyint,
+        has_L1 tinyint, has_L2 tinyint, has_L3 tinyint, has_W tinyint,
+        dist_B tinyint, dist_D1 tinyint, dist_D2 tinyint, dist_D3 tinyint, dist_G tinyint,
+        dist_L1 tinyint, dist_L2 tinyint, dist_L3 tinyint, dist_W tinyint,
+        median_tone tinyint, furthest_shade tinyint, Constraint pk_fn Primary key(filename))
+        """)
+        hash_conn.execute("""
+        CREATE TABLE IF NOT EXISTS osx_hashes
+        (filename tinytext, codepoint_part varchar(32), a_hash varchar(64),
+        c_hash varchar(49), d_hash varchar(64), Constraint pk_fn Primary key(filename))
+        """)
+        with Pool(N_CORES) as pool:
+            png_batches = [*chunked(pngs, BATCH_SIZE)]
+            row_batches = pool.imap(preprocess_batch, png_batches)
+            for bw_rows, hash_rows in tqdm(row_batches, total=len(png_batches)):
+                # Replace any rows from a previous run rather than violating `pk_fn`
+                bw_conn.executemany(
+                    "INSERT OR REPLACE INTO images VALUES "
+                    "(?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)",
+                    bw_rows
+                )
+                hash_conn.executemany(
+                    "INSERT OR REPLACE INTO osx_hashes VALUES (?,?,?,?,?)", hash_rows
+                )
+                bw_conn.commit()
+                hash_conn.commit()
@@ -0,0 +1,110 @@
+# Extract the PNG glyphs of an sbix strike straight from a font collection (TTC) or
+# font (TTF), without first splitting it into TTF files (`ttc2ttf.py`) or parsing it
+# fully with fontTools (`sbix_extract.py`), by memory-mapping the file and writing the
+# PNG payloads from zero-copy slices of it.
+# https://developer.apple.com/fonts/TrueType-Reference-Manual/RM06/Chap6sbix.html
+# Usage: python sbix_stream_extract.py FONT [face] [ppem] [out_dir]
+# (face defaults to 0, ppem (if omitted or "") to the largest strike and out_dir to
+# the current directory)
+import mmap
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from struct import unpack_from
+from fontTools.ttLib import TTFont
+
+N_WRITERS = 8 # writer threads (file writes release the GIL)
+
+def face_offset(buf, face=0):
+    "Return the offset of the table directory of font number `face` in `buf`"
+    if buf[:4] != b"ttcf":
+        return 0
+    ttf_count = unpack_from("!L", buf, 0x08)[0]
+    if not 0 <= face < ttf_count:
+        raise ValueError(f"Face {face} out of range: collection has {ttf_count} fonts")
+    return unpack_from("!L", buf, 0x0C + face * 4)[0]
+
+def table_record(buf, table_dir_offset, tag):
+    "Return the `(offset, length)` of the table `tag` in the given table directory"
+    table_count = unpack_from("!H", buf, table_dir_offset + 0x04)[0]
+    for j in range(table_count):
+        record = table_dir_offset + 0x0C + j * 0x10
+        if buf[record:record + 4] == tag:
+            offset, length = unpack_from("!LL", buf, record + 0x08)
+            return offset, length
+    raise KeyError(f"No {tag.decode()!r} table in font")
+
+def sbix_strikes(buf, table_dir_offset):
+    "Return a dict of each sbix strike's ppem to its offset in `buf`"
+    sbix_offset, _ = table_record(buf, table_dir_offset, b"sbix")
+    num_strikes = unpack_from("!L", buf, sbix_offset + 0x04)[0]
+    strike_offsets = unpack_from(f"!{num_strikes}L", buf, sbix_offset + 0x08)
+    return {
+        unpack_from("!H", buf, sbix_offset + s)[0]: sbix_offset + s
+        for s in strike_offsets
+    }
+
+def strike_pngs(buf, strike_offset, num_glyphs):
+    """
+    Yield the glyph ID and a `memoryview` of the PNG data of each glyph in the strike
+    at `strike_offset` whose graphic type is "png " (empty and "dupe" glyphs are
+    skipped, as `sbix_extract.py` skips them).
+    """
+    data_offsets = unpack_from(f"!{num_glyphs + 1}L", buf, strike_offset + 0x04)
+    view = memoryview(buf)
+    for glyph_id in range(num_glyphs):
+        start, end = data_offsets[glyph_id:glyph_id + 2]
+        if end - start <= 8:
+            continue # no glyph data
+        glyph_offset = strike_offset + start
+        if buf[glyph_offset + 4:glyph_offset + 8] == b"png ":
+            yield glyph_id, view[glyph_offset + 8:strike_offset + end]
+
+def write_png(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+
+def extract_sbix(font_path, face=0, ppem=None, out_dir=".", n_writers=N_WRITERS):
+    """
+    Write each PNG glyph of the sbix strike with `ppem` pixels per em (default: the
+    largest) of font number `face` of the font file at `font_path` to `out_dir` as
+    `glyph-{glyph name}.png`, returning the number of PNGs written.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    with open(font_path, "rb") as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        table_dir_offset = face_offset(buf, face)
+        # Only the glyph names are read by fontTools (lazily, from the `post` table)
+        glyph_order = TTFont(font_path, fontNumber=face, lazy=True).getGlyphOrder()
+        strikes = sbix_strikes(buf, table_dir_offset)
+        if ppem is None:
+            ppem = max(strikes)
+        elif ppem not in strikes:
+            raise ValueError(f"No {ppem} ppem strike (available: {sorted(strikes)})")
+        maxp_offset, _ = table_record(buf, table_dir_offset, b"maxp")
+        num_glyphs = unpack_from("!H", buf, maxp_offset + 0x04)[0]
+        pngs = strike_pngs(buf, strikes[ppem], num_glyphs)
+        with ThreadPoolExecutor(n_writers) as executor:
+            futures = [
+                executor.submit(
+                    write_png, out_dir / f"glyph-{glyph_order[glyph_id]}.png", data
+                )
+                for glyph_id, data in pngs
+            ]
+            for future in futures:
+                future.result()
+        # Release the slices before the map is closed
+        del pngs
+    return len(futures)
+
+if __name__ == "__main__":
+    if not 2 <= len(sys.argv) <= 5:
+        print(f"Usage: {sys.argv[0]} FONT [face] [ppem] [out_dir]", file=sys.stderr)
+        sys.exit(2)
+    font_path = sys.argv[1]
+    face = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+    ppem = int(sys.argv[3]) if len(sys.argv) > 3 and sys.argv[3] else None
+    out_dir = sys.argv[4] if len(sys.argv) > 4 else "."
+    n_written = extract_sbix(font_path, face, ppem, out_dir)
+    print(f"Wrote {n_written} PNGs to {out_dir}", file=sys.stderr)
@@ -56,8 +56,10 @@ else:
 
         total_length = header_length + table_length
         new_buf = bytearray(total_length)
-        header = unpack_from(header_length * "c", buf, table_header_offset)
-        pack_into(header_length * "c", new_buf, 0, *header)
+        # Copy by slices rather than unpacking a tuple of each byte
+        new_buf[:header_length] = buf[
+            table_header_offset : table_header_offset + header_length
+        ]
         current_offset = header_length
 
         for j in range(table_count):
@@ -69,8 +71,9 @@ else:
             )[0]
             pack_into("!L", new_buf, 0x0C + 0x08 + j * 0x10, current_offset)
             print(length)
-            current_table = unpack_from(length * "c", buf, offset)
-            pack_into(length * "c", new_buf, current_offset, *current_table)
+            new_buf[current_offset : current_offset + length] = buf[
+                offset : offset + length
+            ]
 
             # table_checksum = sum(unpack_from("!"+("L"*length), new_buf, current_offset))
             # pack_into("!L", new_buf, 0x0C+0x04+j*0x10, table_checksum)
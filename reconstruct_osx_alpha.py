@@ -0,0 +1,72 @@
+from pathlib import Path
+import sqlite3
+from multiprocessing import cpu_count
+from sys import stderr
+from alpha_reconstruction import reconstruct_glyphs, report_reconstructions
+from image_writer import FINAL, IMAGE_SUFFIXES
+from shade_lookup import load_shades
+
+# Reconstruct the transparency of every enlarged glyph (see `alpha_reconstruction.py`)
+# in parallel, recording each glyph's time taken and residual loss
+
+# Worker processes (each holds a few float copies of a 2000x2000 glyph, ~1GB)
+N_CORES = max(1, cpu_count() // 2)
+
+osx_dir = Path("osx/catalina/").absolute()
+source_dir = osx_dir / "png"
+preproc_dir = osx_dir / "bg"
+png_dir = Path("enlarged/").absolute()
+# Memory-mapped arrays of the enlarged glyphs (see `array_store.py`) if
+# `enlarge_osx_glyphs.py` stored them, e.g. `Path("enlarged_npy").absolute()`, or None
+# to decode each glyph
+array_dir = None
+out_dir = Path("transparent/").absolute()
+osx_bw_db = osx_dir / "emoji_bw_calc.db"
+metrics_db = Path("alpha_reconstruction.db").absolute()
+NO_OVERWRITE = True
+WRITER_OPTIONS = FINAL # The transparent glyphs are the final deliverables
+# Stop re-estimating alpha after this many passes (1 gives the scripts' single pass), or
+# once the residual mean absolute error is at most TOLERANCE (in levels), whichever comes
+# first (see `reestimate_alpha`)
+MAX_ITER = 16
+TOLERANCE = 0
+
+# Guard the entry point so worker processes can safely re-import this module
+if __name__ == "__main__":
+    out_dir.mkdir(exist_ok=True)
+    shades = load_shades(osx_bw_db)
+    pngs = sorted(p for p in png_dir.iterdir() if p.suffix in IMAGE_SUFFIXES)
+    jobs = []
+    for png in pngs:
+        name = f"{png.stem}.png"
+        output_png = out_dir / name
+        if output_png.exists() and NO_OVERWRITE:
+            continue
+        jobs.append((
+            png, source_dir / name, preproc_dir / name, output_png, shades[name],
+            array_dir, WRITER_OPTIONS, MAX_ITER, TOLERANCE
+        ))
+    results = {}
+    with sqlite3.connect(metrics_db) as conn:
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS reconstructions
+        (filename tinytext, seconds float, residual_mae float, residual_frac float,
+        iterations int, Constraint pk_fn Primary key(filename))
+        """)
+        try:
+            for name, seconds, result in reconstruct_glyphs(jobs, N_CORES):
+                if isinstance(result, Exception):
+                    print(f"Failed to reconstruct '{name}': {result!r}", file=stderr)
+                    continue
+                results[name] = seconds, result
+                conn.execute(
+                    "INSERT OR REPLACE INTO reconstructions VALUES (?,?,?,?,?)",
+                    (
+                        name, seconds, result.residual_mae, result.residual_frac,
+                        result.iterations
+                    )
+                )
+                conn.commit()
+        except KeyboardInterrupt as e:
+            print(f"Exitting early...", file=stderr)
+    report_reconstructions(results)
@@ -4,8 +4,9 @@ import pandas as pd
 from tqdm import tqdm
 from sys import stderr
 from imageio import imread, imwrite
+from alpha_reconstruction import upscale_to_0_255
+from array_store import load_image
 import numpy as np
-from skimage import transform as tf
 from matplotlib import pyplot as plt
 from transform_utils import scale_pixel_box_coordinates, crop_image
 from compare_one_sr_alpha_mask import get_emoji_rgb_bg, alpha_composite_bg, plot_comparison
@@ -17,6 +18,9 @@ osx_dir = Path("osx/catalina/").absolute()
 source_dir = osx_dir / "png"
 preproc_dir = osx_dir / "bg/"
 png_dir = Path("enlarged/").absolute()
+# Memory-mapped arrays of the enlarged glyphs, so boxes are cropped without a full
+# decode, if `enlarge_osx_glyphs.py` stored them (e.g. `Path("enlarged_npy")`)
+enlarged_array_dir = None
 out_dir = Path("transparent/").absolute()
 png = png_dir / "glyph-u1F343.png"
 osx_bw_db = osx_dir / "emoji_bw_calc.db"
@@ -34,7 +38,7 @@ box_top_l = (0,104)
 box_bot_r = (56,160)
 box = [box_top_l, box_bot_r]
 # Remove the mask and show the result
-img = imread(png)
+img = load_image(png, enlarged_array_dir)
 source_img = imread(source_png)
 preproc_img = imread(preproc_png)
 scale = img.shape[0] / source_img.shape[0]
@@ -43,21 +47,11 @@ source_img_sub = crop_image(source_img, box)
 preproc_img_sub = crop_image(preproc_img, box)
 source_img_sub_alpha = source_img_sub[:,:,3]
 img_sub = crop_image(img, scaled_box)
-scaled_preproc_img_sub = tf.resize(
-    preproc_img_sub[:,:,:3], img_sub.shape, order=0
+scaled_preproc_img_sub = upscale_to_0_255(preproc_img_sub[:,:,:3], img_sub.shape)
+scaled_source_img_sub = upscale_to_0_255(source_img_sub[:,:,:3], img_sub.shape)
+scaled_source_img_sub_alpha = upscale_to_0_255(
+    source_img_sub_alpha, img_sub[:,:,0].shape
 )
-scaled_source_img_sub = tf.resize(
-    source_img_sub[:,:,:3], img_sub.shape, order=0
-)
-scaled_source_img_sub_alpha = tf.resize(
-    source_img_sub_alpha, img_sub[:,:,0].shape, order=0
-)
-scaled_preproc_img_sub *= (1/scaled_preproc_img_sub.max()) * 255
-scaled_preproc_img_sub = scaled_preproc_img_sub.astype(int)#img.dtype)
-scaled_source_img_sub *= (1/scaled_source_img_sub.max()) * 255
-scaled_source_img_sub = scaled_source_img_sub.astype(int)#img.dtype)
-scaled_source_img_sub_alpha *= (1/scaled_source_img_sub_alpha.max()) * 255
-scaled_source_img_sub_alpha = scaled_source_img_sub_alpha.astype(int)#img.dtype)
 scaled_source_img_sub_im = scaled_source_img_sub.copy() # Retain 3 channel copy
 scaled_source_img_sub = np.insert(scaled_source_img_sub, 3, scaled_source_img_sub_alpha, axis=2)
 composited_grad = img_sub.astype(int) - scaled_preproc_img_sub
@@ -4,12 +4,12 @@ import pandas as pd
 from tqdm import tqdm
 from sys import stderr
 from imageio import imread, imwrite
+from alpha_reconstruction import upscale_to_0_255
+from array_store import load_image
 import numpy as np
-from skimage import transform as tf
-from skimage.util import img_as_ubyte, img_as_float
 from matplotlib import pyplot as plt
-from transform_utils import scale_pixel_box_coordinates, crop_image
-from scipy.ndimage import convolve
+from compositing import alpha_composite_bg
+from transform_utils import scale_pixel_box_coordinates, crop_image, get_neighbour_mask
 
 SAVING_PLOT = True
 JUPYTER = True
@@ -18,50 +18,14 @@ osx_dir = Path("osx/catalina/").absolute()
 source_dir = osx_dir / "png"
 preproc_dir = osx_dir / "bg/"
 png_dir = Path("enlarged/").absolute()
+# Memory-mapped arrays of the enlarged glyphs, so boxes are cropped without a full
+# decode, if `enlarge_osx_glyphs.py` stored them (e.g. `Path("enlarged_npy")`)
+enlarged_array_dir = None
 out_dir = Path("transparent/").absolute()
 png = png_dir / "glyph-u1F343.png"
 osx_bw_db = osx_dir / "emoji_bw_calc.db"
 NO_OVERWRITE = False
 
-def get_neighbour_mask(arr, max_val=1, neighbour_dist=1):
-    """
-    Convolve a linear filter (default: 3x3, i.e. 1 neighbour on each side), reflecting
-    at the boundaries (i.e. as if convolving on an image expanded by one pixel at each
-    border) and then compare the result against the maximum possible value, `max_val`
-    (default: 1) from the kernel (i.e. thereby report if a given pixel is completely 
-    surrounded by the maximum value).
-    """
-    kernel_shape = np.repeat(1 + (2 * neighbour_dist), 2)
-    kernel = np.ones(kernel_shape)
-    kernel_max = kernel.sum() * max_val
-    mask = convolve(arr, kernel) == kernel_max
-    return mask
-
-def alpha_composite_bg(img, background_shade):
-    """
-    Linearly composite an RGBA image against a grayscale background. Image dtype
-    is preserved. Output height/width will match those of `im`, but the alpha
-    channel dimension will be dropped making it only RGB.
-    """
-    if not isinstance(background_shade, int):
-        raise TypeError("background_shade must be an integer")
-    im = img.astype(float)
-    bg = background_shade / 255
-    im_max = im.max()
-    im /= im_max # scale im to [0,1]
-    im_rgb = im[:,:,:3]
-    bg_rgb = np.ones_like(im_rgb) * bg
-    # Scale RGB according to A
-    alpha_im = im[:,:,3]
-    alpha_bg = 1 - alpha_im
-    im_rgb *= alpha_im[:,:,None]
-    bg_rgb *= alpha_bg[:,:,None]
-    composited = im_rgb + bg_rgb
-    # Rescale to original range and return to original dtype
-    composited *= im_max
-    composited = composited.astype(img.dtype)
-    return composited
-
 def plot_fig(
         scaled_source_img_sub_alpha,
         scaled_source_img_sub,
@@ -144,7 +108,7 @@ box_top_l = (0,104)
 box_bot_r = (56,160)
 box = [box_top_l, box_bot_r]
 # Remove the mask and show the result
-img = imread(png)
+img = load_image(png, enlarged_array_dir)
 source_img = imread(source_png)
 preproc_img = imread(preproc_png)
 scale = img.shape[0] / source_img.shape[0]
@@ -154,27 +118,9 @@ preproc_img_sub = crop_image(preproc_img, box)
 source_img_sub_alpha = source_img_sub[:,:,3]
 img_sub = crop_image(img, scaled_box)
 
-def rescale_float_img_to_0_255_int64(float_img):
-    """
-    tf.resize has not preserved range, so multiply the `float_img` by the reciprocal of
-    its maximum (to restore to the range [0,1]) then transform to [0,255] then convert
-    the uint8 type to int64
-    """
-    if (float_img < 0).any():
-        raise ValueError("Error: about to clip sub-zero values via `img_as_ubyte`")
-    return img_as_ubyte( float_img * np.reciprocal(float_img.max()) ).astype(int)
-
-scaled_preproc_img_sub = rescale_float_img_to_0_255_int64(
-    tf.resize(preproc_img_sub[:,:,:3], img_sub.shape, order=0)
-)
-
-scaled_source_img_sub = rescale_float_img_to_0_255_int64(
-    tf.resize(source_img_sub[:,:,:3], img_sub.shape, order=0)
-)
-
-scaled_source_img_sub_alpha = rescale_float_img_to_0_255_int64(
-    tf.resize(source_img_sub_alpha, img_sub[:,:,0].shape, order=0)
-)
+scaled_preproc_img_sub = upscale_to_0_255(preproc_img_sub[:,:,:3], img_sub.shape)
+scaled_source_img_sub = upscale_to_0_255(source_img_sub[:,:,:3], img_sub.shape)
+scaled_source_img_sub_alpha = upscale_to_0_255(source_img_sub_alpha, img_sub[:,:,0].shape)
 scaled_source_img_sub = np.insert(scaled_source_img_sub, 3, scaled_source_img_sub_alpha, axis=2)
 
 composited_grad = img_sub.astype(int) - scaled_preproc_img_sub
@@ -1,12 +1,12 @@
 from pathlib import Path
-import sqlite3
-import pandas as pd
 from tqdm import tqdm
 from sys import stderr
 from imageio import imread, imwrite
+from alpha_reconstruction import upscale_to_0_255
+from array_store import load_image
 import numpy as np
-from skimage import transform as tf
 from matplotlib import pyplot as plt
+from shade_lookup import get_rgb_shade
 from transform_utils import scale_pixel_box_coordinates, crop_image
 
 VIEWING = True
@@ -16,17 +16,16 @@ osx_dir = Path("osx/catalina/").absolute()
 source_dir = osx_dir / "png"
 preproc_dir = osx_dir / "bg/"
 png_dir = Path("enlarged/").absolute()
+# Memory-mapped arrays of the enlarged glyphs, so boxes are cropped without a full
+# decode, if `enlarge_osx_glyphs.py` stored them (e.g. `Path("enlarged_npy")`)
+enlarged_array_dir = None
 out_dir = Path("transparent/").absolute()
 pngs = [p for p in png_dir.iterdir() if p.suffix == ".png"]
 osx_bw_db = osx_dir / "emoji_bw_calc.db"
 NO_OVERWRITE = False
 
 def get_emoji_rgb_bg(glyph):
-    with sqlite3.connect(osx_bw_db) as conn:
-        query_sql = "SELECT * FROM images WHERE filename == (?)"
-        query_df = pd.read_sql(query_sql, con=conn, params=[glyph])
-        [r] = [g] = [b] = query_df.loc[:, "furthest_shade"].values
-    return r, g, b
+    return get_rgb_shade(glyph, osx_bw_db)
 
 def plot_comparison(
         scaled_source_img_sub_alpha,
@@ -81,7 +80,7 @@ try:
         box_bot_r = (32-offset_brx,146-offset_bry)
         box = [box_top_l, box_bot_r]
         # Remove the mask and show the result
-        img = imread(png)
+        img = load_image(png, enlarged_array_dir)
         source_img = imread(source_png)
         preproc_img = imread(preproc_png)
         scale = img.shape[0] / source_img.shape[0]
@@ -90,21 +89,11 @@ try:
         preproc_img_sub = crop_image(preproc_img, box)
         source_img_sub_alpha = source_img_sub[:,:,3]
         img_sub = crop_image(img, scaled_box)
-        scaled_preproc_img_sub = tf.resize(
-            preproc_img_sub[:,:,:3], img_sub.shape, order=0
+        scaled_preproc_img_sub = upscale_to_0_255(preproc_img_sub[:,:,:3], img_sub.shape)
+        scaled_source_img_sub = upscale_to_0_255(source_img_sub[:,:,:3], img_sub.shape)
+        scaled_source_img_sub_alpha = upscale_to_0_255(
+            source_img_sub_alpha, img_sub[:,:,0].shape
         )
-        scaled_source_img_sub = tf.resize(
-            source_img_sub[:,:,:3], img_sub.shape, order=0
-        )
-        scaled_source_img_sub_alpha = tf.resize(
-            source_img_sub_alpha, img_sub[:,:,0].shape, order=0
-        )
-        scaled_preproc_img_sub *= (1/scaled_preproc_img_sub.max()) * 255
-        scaled_preproc_img_sub = scaled_preproc_img_sub.astype(int)#img.dtype)
-        scaled_source_img_sub *= (1/scaled_source_img_sub.max()) * 255
-        scaled_source_img_sub = scaled_source_img_sub.astype(int)#img.dtype)
-        scaled_source_img_sub_alpha *= (1/scaled_source_img_sub_alpha.max()) * 255
-        scaled_source_img_sub_alpha = scaled_source_img_sub_alpha.astype(int)#img.dtype)
         scaled_source_img_sub = np.insert(scaled_source_img_sub, 3, scaled_source_img_sub_alpha, axis=2)
         composited_grad = img_sub.astype(int) - scaled_preproc_img_sub
         # Rescale from [-255,+255] to [0,1] by incrementing +255 then squashing by half
@@ -0,0 +1,42 @@
+import sqlite3
+from pathlib import Path
+
+__all__ = ["load_shades", "get_shade", "get_rgb_shade"]
+
+osx_bw_db = Path(__file__).resolve().parent / "osx" / "catalina" / "emoji_bw_calc.db"
+
+# Each database's version (see `db_version`) and its filename-to-shade dict, loaded
+# once per process (a pool forked after loading shares the parent's copy)
+_shades = {}
+
+def db_version(db_path):
+    "Return the size and mtime of the DB and its write-ahead log (if any) to spot changes"
+    wal_path = db_path.with_name(f"{db_path.name}-wal")
+    return tuple(
+        (p.stat().st_size, p.stat().st_mtime_ns) for p in (db_path, wal_path) if p.exists()
+    )
+
+def load_shades(db_path=osx_bw_db):
+    """
+    Return a dict of each glyph filename to its background shade (`furthest_shade`)
+    from the `images` table of `db_path`, read in one query the first time and reused
+    until the database file changes.
+    """
+    db_path = Path(db_path).resolve()
+    version = db_version(db_path)
+    cached = _shades.get(db_path)
+    if cached is None or cached[0] != version:
+        with sqlite3.connect(db_path) as conn:
+            shade_sql = "SELECT filename, furthest_shade FROM images"
+            shades = dict(conn.execute(shade_sql).fetchall())
+        _shades[db_path] = version, shades
+    return _shades[db_path][1]
+
+def get_shade(glyph, db_path=osx_bw_db):
+    "Return the background shade of the `glyph` filename"
+    return load_shades(db_path)[glyph]
+
+def get_rgb_shade(glyph, db_path=osx_bw_db):
+    "Return the background shade of the `glyph` filename as an `(r, g, b)` tuple"
+    shade = get_shade(glyph, db_path)
+    return shade, shade, shade
@@ -1,5 +1,8 @@
 import numpy as np
+from functools import lru_cache
 from sys import stderr
+from scipy.ndimage import convolve
+from skimage import transform as tf
 
 def scale_pixel_box_coordinates(box, scale, allow_rounding=False):
     """
@@ -23,3 +26,78 @@ def scale_pixel_box_coordinates(box, scale, allow_rounding=False):
 def crop_image(img, box):
     (x0, y0), (x1,y1) = box
     return img[y0:y1, x0:x1]
+
+def get_neighbour_mask_convolve(arr, max_val=1, neighbour_dist=1):
+    """
+    Convolve a linear filter (default: 3x3, i.e. 1 neighbour on each side), reflecting
+    at the boundaries (i.e. as if convolving on an image expanded by one pixel at each
+    border) and then compare the result against the maximum possible value, `max_val`
+    (default: 1) from the kernel (i.e. thereby report if a given pixel is completely 
+    surrounded by the maximum value).
+    """
+    kernel_shape = np.repeat(1 + (2 * neighbour_dist), 2)
+    kernel = np.ones(kernel_shape)
+    kernel_max = kernel.sum() * max_val
+    mask = convolve(arr, kernel) == kernel_max
+    return mask
+
+def box_sums(arr, neighbour_dist=1):
+    """
+    Sum each pixel's `(2d+1)x(2d+1)` neighbourhood (for `d = neighbour_dist`) of an
+    integer array, reflecting at the boundaries as `convolve` does, from a summed-area
+    table: four lookups per pixel, whatever the neighbourhood size. Sums are int64.
+    """
+    d = neighbour_dist
+    k = 1 + (2 * d)
+    # `np.pad`'s "symmetric" mode is `scipy.ndimage`'s "reflect" (d c b a | a b c d)
+    padded = np.pad(arr.astype(np.int64), d, mode="symmetric")
+    table = np.zeros(np.add(padded.shape, 1), dtype=np.int64)
+    np.cumsum(padded, axis=0, out=table[1:, 1:])
+    np.cumsum(table[1:, 1:], axis=1, out=table[1:, 1:])
+    return table[k:, k:] - table[:-k, k:] - table[k:, :-k] + table[:-k, :-k]
+
+def get_neighbour_mask(arr, max_val=1, neighbour_dist=1):
+    """
+    Report if each pixel is completely surrounded by the maximum value `max_val` within
+    `neighbour_dist` pixels on each side, identically to `get_neighbour_mask_convolve`
+    but from the summed-area table of `box_sums`, so the cost per pixel doesn't grow
+    with the neighbourhood. Integer arrays are summed as int64, which differs from
+    `get_neighbour_mask_convolve` for narrow dtypes: `convolve` sums a uint8 array in
+    uint8, wrapping around (so a neighbourhood of 255 never matches). A uint8 alpha
+    plane (as `nearest_upscale` keeps it) instead gets the mask `convolve` gives for it
+    as int64, as the planes were before (see `benchmark_neighbour_mask.py`). Float
+    arrays, and integer arrays whose sums would not be exact in `convolve`'s float64,
+    fall back to `convolve`.
+    """
+    k = 1 + (2 * neighbour_dist)
+    if arr.ndim != 2 or not np.issubdtype(arr.dtype, np.integer) or arr.size == 0:
+        return get_neighbour_mask_convolve(arr, max_val, neighbour_dist)
+    if k * k * max(abs(int(arr.min())), abs(int(arr.max()))) > 2 ** 53:
+        return get_neighbour_mask_convolve(arr, max_val, neighbour_dist)
+    return box_sums(arr, neighbour_dist) == k * k * max_val
+
+@lru_cache(maxsize=None)
+def nearest_indices(in_size, out_size):
+    """
+    Return the index of the input pixel nearest to each of `out_size` output pixels
+    along an axis of `in_size`, as `tf.resize(..., order=0)` picks them (computed by
+    resizing the 1D range of indices, so its rounding of ties is matched exactly).
+    """
+    indices = tf.resize(
+        np.arange(in_size, dtype=float), (out_size,), order=0, preserve_range=True,
+        anti_aliasing=False
+    )
+    return indices.astype(np.intp)
+
+def nearest_upscale(img, shape):
+    """
+    Nearest-neighbour resize `img` to `shape`, giving identical pixels to
+    `tf.resize(img, shape, order=0, preserve_range=True)` but by indexing along each
+    axis that changes size, so the result keeps the dtype of `img` (a uint8 RGB glyph
+    upscaled to 2000x2000 is 12MB rather than 96MB as float64). If no axis changes
+    size, `img` itself is returned.
+    """
+    for axis, (in_size, out_size) in enumerate(zip(img.shape, shape)):
+        if in_size != out_size:
+            img = img.take(nearest_indices(in_size, out_size), axis=axis)
+    return img